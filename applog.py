@@ -0,0 +1,116 @@
+import atexit
+from datetime import datetime
+import os
+import queue
+import threading
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+
+# ============================================
+class AsyncLogger:
+    BATCH = 256
+
+    def __init__(self, path, level='INFO', max_bytes=512 * 1024, backups=3, queue_size=4096, echo=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.echo = echo
+        self.dropped = 0
+        self.set_level(level)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name='log-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def set_level(self, level):
+        self.level = LEVELS.get(str(level).upper(), LEVELS['INFO'])
+
+    def log(self, level, msg, *args):
+        lvl = LEVELS.get(level, LEVELS['INFO'])
+        if lvl < self.level or self._closed:
+            return
+        try:
+            self._queue.put_nowait((datetime.now(), level, msg, args))
+        except queue.Full:
+            self.dropped += 1
+            return
+        if lvl >= LEVELS['CRITICAL']:
+            self.flush()
+
+    def flush(self, timeout=2):
+        done = threading.Event()
+        try:
+            self._queue.put((None, None, done, None), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _format(self, stamp, level, msg, args):
+        if args:
+            try:
+                msg = msg % args
+            except Exception:
+                msg = f'{msg} {args!r}'
+        return f"[{stamp.strftime('%Y-%m-%d %H:%M:%S')}] [{level}] {msg}\n"
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            waiters = []
+            for stamp, level, msg, args in batch:
+                if stamp is None:
+                    waiters.append(msg)
+                else:
+                    lines.append(self._format(stamp, level, msg, args))
+            if self.dropped:
+                lines.append(self._format(datetime.now(), 'WARNING', '%d log messages dropped', (self.dropped,)))
+                self.dropped = 0
+            if lines:
+                self._write(''.join(lines))
+            for done in waiters:
+                done.set()
+
+    def _write(self, text):
+        if self.echo:
+            print(text, end='')
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(text)
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            self._file = None
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in range(self.backups - 1, 0, -1):
+            src = f'{self.path}.{i}'
+            if os.path.exists(src):
+                os.replace(src, f'{self.path}.{i + 1}')
+        if self.backups > 0:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
@@ -4,8 +4,9 @@ package.name = MagPro
 package.domain = org.magpro
 source.dir = .
 source.include_exts = py,png,jpg,kv,atlas,json,ttf
+source.exclude_dirs = tools, bin, .buildozer, __pycache__
 version = 7.1.0
-requirements = python3,kivy,kivymd,requests,urllib3,pillow,arabic-reshaper,python-bidi==0.4.2,six,future,certifi,chardet,idna,android,jnius
+requirements = python3,sqlite3,kivy,kivymd,requests,urllib3,pillow,arabic-reshaper,python-bidi==0.4.2,six,future,certifi,chardet,idna,android,jnius
 icon.filename = apk_icon3.png
 orientation = portrait
 fullscreen = 0
@@ -0,0 +1,582 @@
+from array import array
+from bisect import bisect_left
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import unicodedata
+from urllib.parse import quote
+
+CATALOG_ENDPOINT = '/api/products'
+
+# ============================================
+def header_value(headers, name):
+    if not headers:
+        return None
+    lname = name.lower()
+    for k, v in dict(headers).items():
+        if str(k).lower() == lname:
+            return v
+    return None
+
+NORM_VERSION = 2
+_NORM_TABLE = str.maketrans({'\u0629': '\u0647', '\u0649': '\u064a', '\u0640': None, '\u0671': '\u0627'})
+
+def normalize_text(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.translate(_NORM_TABLE).casefold().split())
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def product_key(p):
+    return str(p.get('id'))
+
+WEIGHABLE_UNITS = ('kg', 'g', 'gramme', 'kilogramme', 'كغ', 'غرام', 'kilo', 'لتر', 'l', 'litre')
+_unit_cache = {}
+
+def is_weighable(unit):
+    # A catalog carries a handful of distinct unit strings, so the substring
+    # scan runs once per spelling instead of once per product.
+    ok = _unit_cache.get(unit)
+    if ok is None:
+        u = str(unit or '').lower().strip()
+        ok = _unit_cache[unit] = any((w in u for w in WEIGHABLE_UNITS))
+    return ok
+
+def parse_price(value):
+    if type(value) in (int, float):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '.'))
+    except:
+        return 0.0
+
+def normalize_product(p):
+    price = parse_price(p.get('price', 0))
+    if price <= 0 or not is_weighable(p.get('unit', '')):
+        return None
+    return {'id': p['id'], 'name': p['name'], 'price': price, 'image': p.get('image', ''), 'ref': str(p.get('ref', ''))}
+
+def normalize_products(items):
+    products = []
+    for p in items:
+        product = normalize_product(p)
+        if product is not None:
+            products.append(product)
+    return products
+
+class JsonArrayStream:
+    # Decodes a top-level JSON array one element at a time so the first
+    # products can be shown before the rest of the body is parsed.
+
+    def __init__(self, data):
+        self.data = data
+
+    def __iter__(self):
+        text = self.data.decode('utf-8') if isinstance(self.data, (bytes, bytearray)) else self.data
+        decoder = json.JSONDecoder()
+        ws = ' \t\n\r'
+        n = len(text)
+        i = 0
+        while i < n and text[i] in ws:
+            i += 1
+        if i >= n or text[i] != '[':
+            raise ValueError('not a JSON array')
+        i += 1
+        while True:
+            while i < n and text[i] in ws:
+                i += 1
+            if i < n and text[i] == ']':
+                return
+            item, i = decoder.raw_decode(text, i)
+            yield item
+            while i < n and text[i] in ws:
+                i += 1
+            if i < n and text[i] == ',':
+                i += 1
+            elif i < n and text[i] == ']':
+                return
+            else:
+                raise ValueError(f'malformed JSON array at {i}')
+
+def decode_catalog(data):
+    if not isinstance(data, (bytes, bytearray)):
+        return data
+    if data.lstrip()[:1] == b'[':
+        return JsonArrayStream(data)
+    try:
+        return json.loads(data.decode('utf-8'))
+    except ValueError:
+        return None
+
+def stream_catalog(source, on_chunk=None, is_stale=None, first_chunk=60, chunk_size=500):
+    raws = []
+    products = []
+    chunk = []
+    limit = first_chunk
+    for n, raw in enumerate(source):
+        if is_stale and n % 256 == 0 and is_stale():
+            return None
+        raws.append(raw)
+        product = normalize_product(raw)
+        if product is None:
+            continue
+        products.append(product)
+        chunk.append(product)
+        if len(chunk) >= limit:
+            if on_chunk:
+                on_chunk(chunk)
+            chunk = []
+            limit = chunk_size
+    if chunk and on_chunk:
+        on_chunk(chunk)
+    return raws, products
+
+def build_row(p, shape, image_for):
+    return {'text_name': shape(p['name']), 'text_price': f"{p['price']:.2f} DA", 'image_url': image_for(p['image']), 'product_data': p}
+
+def build_rows(products, shape, image_for):
+    return [build_row(p, shape, image_for) for p in products]
+
+class RowCache:
+    # One display row per product, built the first time it is shown and then
+    # shared by every list handed to the view: clearing the search box or
+    # filtering only picks existing rows, nothing per product is allocated
+    # per keystroke. Keyed by id(p); the row holds p, so the id cannot be
+    # reused while the entry exists. A changed product is patched in place,
+    # which updates every selection that holds its row.
+
+    def __init__(self, shape, image_for):
+        self.shape = shape
+        self.image_for = image_for
+        self._rows = {}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def row(self, p):
+        row = self._rows.get(id(p))
+        if row is None:
+            row = self._rows[id(p)] = build_row(p, self.shape, self.image_for)
+        return row
+
+    def rows(self, products):
+        get = self.row
+        return [get(p) for p in products]
+
+    def select(self, products, hits):
+        get = self.row
+        return [get(products[i]) for i in hits]
+
+    def update(self, p):
+        row = self._rows.get(id(p))
+        if row is not None:
+            row.update(build_row(p, self.shape, self.image_for))
+        return row
+
+    def discard(self, p):
+        return self._rows.pop(id(p), None)
+
+def apply_catalog_delta(items, upserts, deleted):
+    result = list(items or [])
+    index = {product_key(p): i for i, p in enumerate(result)}
+    for p in upserts or []:
+        key = product_key(p)
+        if key in index:
+            result[index[key]] = p
+        else:
+            index[key] = len(result)
+            result.append(p)
+    gone = {str(i) for i in deleted or []}
+    if gone:
+        result = [p for p in result if product_key(p) not in gone]
+    return result
+
+# ============================================
+class CatalogSync:
+
+    def __init__(self, etag='', revision=None):
+        self.etag = etag or ''
+        self.revision = revision
+
+    def reset(self):
+        self.etag = ''
+        self.revision = None
+
+    def request_args(self, has_local, force_full=False):
+        headers = {'Content-type': 'application/json'}
+        if force_full or not has_local:
+            return CATALOG_ENDPOINT, headers
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.revision is None:
+            return CATALOG_ENDPOINT, headers
+        return f'{CATALOG_ENDPOINT}?since={quote(str(self.revision))}', headers
+
+    def parse(self, status, headers, body, has_local):
+        body = decode_catalog(body)
+        etag = header_value(headers, 'ETag') or ''
+        revision = header_value(headers, 'X-Catalog-Revision')
+        update = {'kind': 'resync', 'items': None, 'upserts': [], 'deleted': [], 'etag': etag, 'revision': revision}
+        if status == 304:
+            if has_local:
+                update['kind'] = 'unchanged'
+            return update
+        if isinstance(body, (list, JsonArrayStream)):
+            update['kind'] = 'full'
+            update['items'] = body
+            return update
+        if not isinstance(body, dict):
+            return update
+        update['revision'] = body.get('revision', revision)
+        if body.get('full') or ('items' in body and 'base_revision' not in body):
+            update['kind'] = 'full'
+            update['items'] = body.get('items') or []
+            return update
+        base = body.get('base_revision', body.get('since'))
+        if not has_local or base is None or self.revision is None or str(base) != str(self.revision):
+            return update
+        update['kind'] = 'delta'
+        update['upserts'] = body.get('upserts') or body.get('updated') or []
+        update['deleted'] = body.get('deleted') or []
+        return update
+
+    def commit(self, etag, revision):
+        self.etag = etag or ''
+        self.revision = revision
+
+    def is_behind(self, revision):
+        if self.revision is None or revision is None:
+            return False
+        try:
+            return int(revision) > int(self.revision)
+        except (TypeError, ValueError):
+            return str(revision) != str(self.revision)
+
+# ============================================
+class CatalogStore:
+    COLUMNS = ('id', 'ref', 'name', 'price', 'unit', 'image')
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS products (id PRIMARY KEY, ref TEXT, name TEXT, name_norm TEXT, price, unit TEXT, image TEXT, pos INTEGER);'
+            'CREATE INDEX IF NOT EXISTS idx_products_ref ON products(ref);'
+            'CREATE INDEX IF NOT EXISTS idx_products_name_norm ON products(name_norm);'
+            'CREATE INDEX IF NOT EXISTS idx_products_pos ON products(pos);'
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);'
+            'CREATE TABLE IF NOT EXISTS usage (id PRIMARY KEY, count INTEGER NOT NULL DEFAULT 0, last_used REAL);')
+        self._conn.commit()
+        self._jobs = None
+        if self.get_meta('norm_version') != NORM_VERSION:
+            self._renormalize()
+
+    def _renormalize(self):
+        with self._lock, self._conn:
+            rows = self._conn.execute('SELECT id, name FROM products').fetchall()
+            self._conn.executemany('UPDATE products SET name_norm = ? WHERE id = ?', ((normalize_text(name), pid) for pid, name in rows))
+            self._put_meta({'norm_version': NORM_VERSION})
+
+    def _row(self, p, pos):
+        price = p.get('price', 0)
+        if not isinstance(price, (int, float, str)):
+            price = str(price)
+        return (p.get('id'), str(p.get('ref', '')), str(p.get('name', '')), normalize_text(p.get('name', '')), price, str(p.get('unit', '')), p.get('image', '') or '', pos)
+
+    def _put_meta(self, meta):
+        for key, value in (meta or {}).items():
+            self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return default
+        try:
+            return json.loads(row[0])
+        except ValueError:
+            return default
+
+    def has_items(self):
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM products LIMIT 1').fetchone() is not None
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+    def replace_all(self, items, meta=None):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM products')
+            self._conn.executemany('INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (self._row(p, i) for i, p in enumerate(items or [])))
+            self._put_meta(meta)
+
+    def apply_delta(self, upserts, deleted, meta=None):
+        with self._lock, self._conn:
+            next_pos = self._conn.execute('SELECT COALESCE(MAX(pos), -1) + 1 FROM products').fetchone()[0]
+            for p in upserts or []:
+                row = self._conn.execute('SELECT pos FROM products WHERE id = ?', (p.get('id'),)).fetchone()
+                if row is None:
+                    pos = next_pos
+                    next_pos += 1
+                else:
+                    pos = row[0]
+                self._conn.execute('INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?, ?)', self._row(p, pos))
+            self._conn.executemany('DELETE FROM products WHERE id = ?', ((i,) for i in deleted or []))
+            self._put_meta(meta)
+
+    def iter_items(self, batch=500):
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute('SELECT id, ref, name, price, unit, image FROM products ORDER BY pos')
+            rows = cursor.fetchmany(batch)
+            while rows:
+                for row in rows:
+                    yield dict(zip(self.COLUMNS, row))
+                rows = cursor.fetchmany(batch)
+        finally:
+            conn.close()
+
+    def load_items(self):
+        return list(self.iter_items())
+
+    def get(self, product_id):
+        with self._lock:
+            row = self._conn.execute('SELECT id, ref, name, price, unit, image FROM products WHERE id = ?', (product_id,)).fetchone()
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def find_by_ref(self, ref):
+        with self._lock:
+            row = self._conn.execute('SELECT id, ref, name, price, unit, image FROM products WHERE ref = ? LIMIT 1', (str(ref),)).fetchone()
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def bump_usage(self, product_id, n=1):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT INTO usage (id, count, last_used) VALUES (?, ?, ?) ON CONFLICT(id) DO UPDATE SET count = count + excluded.count, last_used = excluded.last_used', (product_id, n, time.time()))
+
+    def load_usage(self):
+        with self._lock:
+            return dict(self._conn.execute('SELECT id, count FROM usage'))
+
+    def import_legacy_json(self, json_path):
+        if not os.path.exists(json_path):
+            return False
+        try:
+            with open(json_path, encoding='utf-8') as f:
+                legacy = json.load(f)
+            items = legacy.get('products_data', {}).get('items') or []
+            meta = legacy.get('catalog_meta', {})
+            if items and not self.has_items():
+                self.replace_all(items, {'etag': meta.get('etag', ''), 'revision': meta.get('revision')})
+            os.remove(json_path)
+            return True
+        except Exception:
+            return False
+
+    def run_async(self, fn, *args, on_done=None):
+        if self._jobs is None:
+            self._jobs = queue.Queue()
+            threading.Thread(target=self._job_loop, name='catalog-store', daemon=True).start()
+        self._jobs.put((fn, args, on_done))
+
+    def _job_loop(self):
+        while True:
+            fn, args, on_done = self._jobs.get()
+            try:
+                result, error = fn(*args), None
+            except Exception as e:
+                result, error = None, e
+            if on_done:
+                try:
+                    on_done(result, error)
+                except Exception:
+                    pass
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# ============================================
+class SearchIndex:
+    SCAN_CHECK = 2048
+
+    def __init__(self, products):
+        self.products = products
+        self.keys = []
+        self.grams = {}
+        refs = []
+        for i, p in enumerate(products):
+            name = normalize_text(p.get('name', ''))
+            ref = normalize_text(p.get('ref', ''))
+            self.keys.append(f'{name}\x00{ref}')
+            if ref:
+                refs.append((ref, i))
+            for g in trigrams(name) | trigrams(ref):
+                posting = self.grams.get(g)
+                if posting is None:
+                    posting = self.grams[g] = array('i')
+                posting.append(i)
+        refs.sort()
+        self.ref_keys = [r for r, _ in refs]
+        self.ref_pos = [i for _, i in refs]
+
+    def ref_prefix(self, q):
+        hits = []
+        k = bisect_left(self.ref_keys, q)
+        while k < len(self.ref_keys) and self.ref_keys[k].startswith(q):
+            hits.append(self.ref_pos[k])
+            k += 1
+        return hits
+
+    def search(self, text, is_stale=None):
+        q = normalize_text(text)
+        if not q:
+            return list(range(len(self.products)))
+        if len(q) < 3:
+            candidates = range(len(self.products))
+        else:
+            postings = []
+            for g in trigrams(q):
+                posting = self.grams.get(g)
+                if posting is None:
+                    return []
+                postings.append(posting)
+            candidates = min(postings, key=len)
+        keys = self.keys
+        hits = []
+        for n, i in enumerate(candidates):
+            if is_stale and n % self.SCAN_CHECK == 0 and is_stale():
+                return None
+            if q in keys[i]:
+                hits.append(i)
+        head = self.ref_prefix(q)
+        if not head:
+            return hits
+        first = set(head)
+        return head + [i for i in hits if i not in first]
+
+class PluIndex:
+    # Exact lookups for codes typed on the keypad. A code that is also the
+    # start of a longer code is ambiguous until the operator stops typing.
+    # Refs and ids keep separate, ref-counted prefix tables so removed or
+    # renamed codes stop counting.
+
+    def __init__(self, products=()):
+        self.by_ref = {}
+        self.by_id = {}
+        self.ref_prefixes = {}
+        self.id_prefixes = {}
+        for p in products:
+            self.add(p)
+
+    def _count(self, prefixes, code, n):
+        for k in range(1, len(code)):
+            key = code[:k]
+            left = prefixes.get(key, 0) + n
+            if left > 0:
+                prefixes[key] = left
+            else:
+                prefixes.pop(key, None)
+
+    def add(self, p):
+        ref = str(p.get('ref', '')).strip()
+        if ref and ref not in self.by_ref:
+            self.by_ref[ref] = p
+            self._count(self.ref_prefixes, ref, 1)
+        pid = str(p.get('id', ''))
+        if pid not in self.by_id:
+            self._count(self.id_prefixes, pid, 1)
+        self.by_id[pid] = p
+
+    def remove(self, p):
+        ref = str(p.get('ref', '')).strip()
+        if ref and self.by_ref.get(ref) is p:
+            del self.by_ref[ref]
+            self._count(self.ref_prefixes, ref, -1)
+        pid = str(p.get('id', ''))
+        if self.by_id.get(pid) is p:
+            del self.by_id[pid]
+            self._count(self.id_prefixes, pid, -1)
+
+    def get(self, product_id):
+        return self.by_id.get(str(product_id))
+
+    def lookup(self, code):
+        # A match in either table still waits if the code also starts a
+        # longer ref or id: typing ref 100076 must not stop at id 1000.
+        ambiguous = code in self.ref_prefixes or code in self.id_prefixes
+        p = self.by_ref.get(code)
+        if p is None:
+            p = self.by_id.get(code)
+        return p, ambiguous
+
+def rank_by_usage(hits, products, usage):
+    # Products sold before come first, most used first; the rest keep the
+    # search order. Only the used subset is sorted.
+    if not usage:
+        return hits
+    used, rest = [], []
+    for i in hits:
+        n = usage.get(products[i]['id'])
+        if n:
+            used.append((-n, len(used), i))
+        else:
+            rest.append(i)
+    if not used:
+        return hits
+    used.sort()
+    return [i for _, _, i in used] + rest
+
+# ============================================
+class QueryRunner:
+
+    def __init__(self, name='query', log=None):
+        self.name = name
+        self.log = log
+        self.generation = 0
+        self._pending = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, fn, on_done):
+        with self._cond:
+            self.generation += 1
+            self._pending = (self.generation, fn, on_done)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self):
+        with self._cond:
+            self.generation += 1
+            self._pending = None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                gen, fn, on_done = self._pending
+                self._pending = None
+            is_stale = lambda: gen != self.generation
+            try:
+                result = fn(is_stale)
+            except Exception as e:
+                # A failed query still answers, empty, so the caller is not
+                # left waiting on a result that never comes.
+                if self.log:
+                    self.log('Query error: %s', e, level='WARNING')
+                result = []
+            if result is not None and not is_stale():
+                on_done(result)
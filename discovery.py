@@ -0,0 +1,115 @@
+import json
+import os
+import socket
+import threading
+import time
+
+DISCOVERY_PORT = 50555
+SERVICE = 'magpro'
+REQUEST = b'MAGPRO-DISCOVER'
+
+# ============================================
+def make_request(nonce):
+    return REQUEST + b' 1 ' + nonce.encode('ascii')
+
+def parse_request(data):
+    # "MAGPRO-DISCOVER <version> <nonce>"; anything else is ignored.
+    parts = data.split()
+    if len(parts) != 3 or parts[0] != REQUEST:
+        return None
+    return parts[2].decode('ascii', 'ignore')
+
+def make_reply(nonce, http_port, name=''):
+    return json.dumps({'service': SERVICE, 'nonce': nonce, 'port': int(http_port), 'name': name}).encode('utf-8')
+
+def local_addresses():
+    # Connecting a UDP socket sends nothing but makes the kernel pick the
+    # interface holding the default route.
+    addrs = set()
+    for probe in ('10.255.255.255', '192.168.255.255'):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            s.connect((probe, 1))
+            addrs.add(s.getsockname()[0])
+        except OSError:
+            pass
+        finally:
+            s.close()
+    return [a for a in addrs if not a.startswith('127.') and a != '0.0.0.0']
+
+def broadcast_targets():
+    # The limited broadcast is not forwarded by every Wi-Fi access point, so
+    # the /24 directed broadcast of the local address goes out as well.
+    targets = ['255.255.255.255']
+    for ip in local_addresses():
+        targets.append(ip.rsplit('.', 1)[0] + '.255')
+    return targets
+
+# ============================================
+class ServerDiscovery:
+    # One UDP socket probes the cached servers directly and the LAN by
+    # broadcast in the same burst. A known server answers within a few ms,
+    # and the window closes `settle` seconds after the first reply instead
+    # of waiting out the full timeout. Unanswered probes are sent once more
+    # after `resend` to cover a lost datagram.
+
+    def __init__(self, port=DISCOVERY_PORT, timeout=0.8, settle=0.08, resend=0.2, log=None):
+        self.port = port
+        self.log = log
+        self.timeout = timeout
+        self.settle = settle
+        self.resend = resend
+        self.runs = 0
+
+    def probe(self, known=()):
+        self.runs += 1
+        nonce = os.urandom(6).hex()
+        message = make_request(nonce)
+        targets = list(dict.fromkeys([ip for ip in known if ip] + broadcast_targets()))
+        found = {}
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            sock.bind(('', 0))
+            started = time.monotonic()
+            deadline = started + self.timeout
+            self._send(sock, message, targets)
+            resent = False
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if not resent and not found and now - started >= self.resend:
+                    self._send(sock, message, targets)
+                    resent = True
+                wake = deadline if resent or found else min(deadline, started + self.resend)
+                sock.settimeout(max(wake - now, 0.001))
+                try:
+                    data, (ip, _) = sock.recvfrom(2048)
+                except socket.timeout:
+                    continue
+                rtt = time.monotonic() - started
+                try:
+                    reply = json.loads(data)
+                except ValueError:
+                    continue
+                if not isinstance(reply, dict) or reply.get('service') != SERVICE or reply.get('nonce') != nonce or ip in found:
+                    continue
+                found[ip] = {'ip': ip, 'port': int(reply.get('port') or 0), 'name': str(reply.get('name', '')), 'rtt_ms': round(rtt * 1000, 1)}
+                deadline = min(deadline, time.monotonic() + self.settle)
+        except OSError as e:
+            if self.log:
+                self.log('Discovery error: %s', e, level='WARNING')
+        finally:
+            sock.close()
+        return sorted(found.values(), key=lambda s: s['rtt_ms'])
+
+    def _send(self, sock, message, targets):
+        for ip in targets:
+            try:
+                sock.sendto(message, (ip, self.port))
+            except OSError:
+                pass
+
+    def probe_async(self, known, on_done):
+        threading.Thread(target=lambda: on_done(self.probe(known)), name='discovery', daemon=True).start()
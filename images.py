@@ -0,0 +1,182 @@
+from collections import OrderedDict
+import io
+import os
+import threading
+import time
+import urllib.request
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# ============================================
+def image_filename(path):
+    if not path:
+        return ''
+    return os.path.basename(str(path).replace('\\', '/'))
+
+def urllib_fetch(url, timeout=5):
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        return resp.read()
+
+def make_thumbnail(data, name, size):
+    if Image is None or not size:
+        return data
+    ext = os.path.splitext(name)[1].lower()
+    fmt = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}.get(ext)
+    if not fmt:
+        return data
+    try:
+        img = Image.open(io.BytesIO(data))
+        if img.width <= size and img.height <= size:
+            return data
+        if fmt == 'JPEG':
+            img.draft('RGB', (size, size))
+            img = img.convert('RGB')
+        img = ImageOps.fit(img, (size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        params = {'optimize': True} if fmt == 'PNG' else {'quality': 85, 'optimize': True}
+        img.save(out, fmt, **params)
+        return out.getvalue()
+    except Exception:
+        return data
+
+# ============================================
+class DiskImageCache:
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._scan()
+
+    def _scan(self):
+        found = []
+        try:
+            for entry in os.scandir(self.directory):
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith('.part'):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+                    continue
+                st = entry.stat()
+                found.append((st.st_mtime, entry.name, st.st_size))
+        except OSError:
+            return
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self.total += size
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        if not name:
+            return None
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        return self.path(name)
+
+    def put(self, name, data):
+        final = self.path(name)
+        tmp = f'{final}.{threading.get_ident()}.part'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, final)
+        with self._lock:
+            self.total += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+        self.evict()
+        return final
+
+    def evict(self):
+        victims = []
+        with self._lock:
+            while self.total > self.max_bytes and len(self._entries) > 1:
+                name, size = self._entries.popitem(last=False)
+                self.total -= size
+                victims.append(name)
+        for name in victims:
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+        return victims
+
+# ============================================
+class ImageLoader:
+    RETRY_AFTER = 60
+
+    def __init__(self, cache, url_for, fetch=None, workers=3, thumb_px=None, max_pending=48, on_ready=None):
+        self.cache = cache
+        self.url_for = url_for
+        self.fetch = fetch or urllib_fetch
+        self.workers = workers
+        self.thumb_px = thumb_px
+        self.max_pending = max_pending
+        self.on_ready = on_ready
+        self._pending = OrderedDict()
+        self._inflight = set()
+        self._failed = {}
+        self._threads = []
+        self._cond = threading.Condition()
+
+    def request(self, name):
+        if not name:
+            return None
+        path = self.cache.get(name)
+        if path:
+            return path
+        with self._cond:
+            if name in self._inflight:
+                return None
+            failed_at = self._failed.get(name)
+            if failed_at and time.monotonic() - failed_at < self.RETRY_AFTER:
+                return None
+            if name in self._pending:
+                self._pending.move_to_end(name)
+            else:
+                self._pending[name] = None
+                while len(self._pending) > self.max_pending:
+                    self._pending.popitem(last=False)
+            if len(self._threads) < self.workers:
+                t = threading.Thread(target=self._loop, name=f'image-loader-{len(self._threads)}', daemon=True)
+                self._threads.append(t)
+                t.start()
+            self._cond.notify()
+        return None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                name, _ = self._pending.popitem(last=True)
+                self._inflight.add(name)
+            path = None
+            try:
+                url = self.url_for(name)
+                if url:
+                    data = make_thumbnail(self.fetch(url), name, self.thumb_px)
+                    path = self.cache.put(name, data)
+            except Exception:
+                path = None
+            with self._cond:
+                self._inflight.discard(name)
+                if path:
+                    self._failed.pop(name, None)
+                else:
+                    self._failed[name] = time.monotonic()
+            if path and self.on_ready:
+                try:
+                    self.on_ready(name, path)
+                except Exception:
+                    pass
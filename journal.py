@@ -0,0 +1,214 @@
+from datetime import datetime
+import gzip
+import json
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from printing import compute_total_cents, to_cents
+
+JOURNAL_ENDPOINT = '/api/sales_journal'
+COLUMNS = ('seq', 'ts', 'product_id', 'ref', 'weight', 'copies', 'price_cents', 'total_cents', 'size', 'job')
+
+# ============================================
+def day_of(ts):
+    d = datetime.fromtimestamp(ts)
+    return d.year * 10000 + d.month * 100 + d.day
+
+def entries_from_payload(payload, ts):
+    # One entry per weighing; copies of the same label stay one row.
+    price_cents = to_cents(payload.get('price', 0) or 0)
+    size = f"{payload.get('width_mm', '')}x{payload.get('height_mm', '')}"
+    labels = payload.get('labels') or [{'weight': payload.get('weight', 0), 'copies': 1}]
+    entries = []
+    for label in labels:
+        weight = int(label.get('weight', 0) or 0)
+        entries.append({'ts': ts, 'product_id': payload.get('product_id'), 'ref': str(payload.get('ref', '')), 'weight': weight, 'copies': int(label.get('copies', 1) or 1), 'price_cents': price_cents, 'total_cents': compute_total_cents(price_cents, weight), 'size': size, 'job': payload.get('idempotency_key', '')})
+    return entries
+
+class SalesJournal:
+    # Append-only, integer-encoded rows (grams, cents, epoch seconds) in a
+    # WAL database. Appends are queued and committed in batches on a writer
+    # thread; uploaded rows are pruned after `retention_days`. `install_id`
+    # is created with the database, so seq numbers that restart after a
+    # data wipe never collide with rows the server already has.
+
+    def __init__(self, path, retention_days=90, log=None):
+        self.path = path
+        self.retention_days = retention_days
+        self.log = log
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS sales (seq INTEGER PRIMARY KEY AUTOINCREMENT, ts INTEGER NOT NULL, day INTEGER NOT NULL, product_id, ref TEXT, weight INTEGER, copies INTEGER, price_cents INTEGER, total_cents INTEGER, size TEXT, job TEXT, uploaded INTEGER NOT NULL DEFAULT 0);'
+            'CREATE INDEX IF NOT EXISTS idx_sales_day ON sales(day, product_id);'
+            'CREATE INDEX IF NOT EXISTS idx_sales_pending ON sales(uploaded, seq);'
+            'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);')
+        self._conn.commit()
+        self.install_id = self._get_meta('install_id')
+        if not self.install_id:
+            self.install_id = uuid.uuid4().hex
+            self._put_meta('install_id', self.install_id)
+        self._queue = queue.Queue()
+        threading.Thread(target=self._writer, name='sales-journal', daemon=True).start()
+
+    def append(self, entries):
+        for entry in entries:
+            self._queue.put(entry)
+
+    def flush(self, timeout=2):
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _writer(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [e for e in batch if isinstance(e, dict)]
+            if rows:
+                try:
+                    with self._lock, self._conn:
+                        self._conn.executemany('INSERT INTO sales (ts, day, product_id, ref, weight, copies, price_cents, total_cents, size, job) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', ((int(e['ts']), day_of(e['ts']), e['product_id'], e['ref'], e['weight'], e['copies'], e['price_cents'], e['total_cents'], e['size'], e['job']) for e in rows))
+                except sqlite3.Error as e:
+                    if self.log:
+                        self.log('Sales journal write error: %s', e, level='ERROR')
+            for e in batch:
+                if isinstance(e, threading.Event):
+                    e.set()
+
+    def _get_meta(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _put_meta(self, key, value):
+        with self._lock, self._conn:
+            if value is None:
+                self._conn.execute('DELETE FROM meta WHERE key = ?', (key,))
+            else:
+                self._conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def next_batch(self, limit=500):
+        # The seq range of an unacknowledged batch is frozen (and survives a
+        # restart), so a retry resends exactly the same rows under the same
+        # key even if sales were added meanwhile.
+        with self._lock:
+            frozen = self._get_meta('batch')
+            if frozen:
+                first, _, last = frozen.partition('-')
+                rows = self._conn.execute('SELECT seq, ts, product_id, ref, weight, copies, price_cents, total_cents, size, job FROM sales WHERE uploaded = 0 AND seq BETWEEN ? AND ? ORDER BY seq', (int(first), int(last))).fetchall()
+                if rows:
+                    return rows
+            rows = self.pending(limit)
+            self._put_meta('batch', f'{rows[0][0]}-{rows[-1][0]}' if rows else None)
+            return rows
+
+    def pending(self, limit=500):
+        with self._lock:
+            return self._conn.execute('SELECT seq, ts, product_id, ref, weight, copies, price_cents, total_cents, size, job FROM sales WHERE uploaded = 0 ORDER BY seq LIMIT ?', (limit,)).fetchall()
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM sales WHERE uploaded = 0').fetchone()[0]
+
+    def mark_uploaded(self, last_seq):
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE sales SET uploaded = 1 WHERE uploaded = 0 AND seq <= ?', (last_seq,))
+            self._conn.execute("DELETE FROM meta WHERE key = 'batch'")
+
+    def daily_totals(self, day=None):
+        day = day or day_of(time.time())
+        with self._lock:
+            return self._conn.execute('SELECT product_id, MAX(ref), COUNT(*), SUM(copies), SUM(weight), SUM(total_cents) FROM sales WHERE day = ? GROUP BY product_id ORDER BY SUM(total_cents) DESC', (day,)).fetchall()
+
+    def prune(self):
+        cutoff = day_of(time.time() - self.retention_days * 86400)
+        with self._lock:
+            with self._conn:
+                removed = self._conn.execute('DELETE FROM sales WHERE uploaded = 1 AND day < ?', (cutoff,)).rowcount
+            if removed:
+                self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return removed
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+# ============================================
+class JournalUploader:
+    # Ships pending rows as one gzip'd JSON body per batch, only while the
+    # scale is idle, so uploads never compete with a sale for the link.
+    RETRY_MAX = 3600
+
+    def __init__(self, journal, api, schedule, is_idle=None, device_id='', endpoint=JOURNAL_ENDPOINT, batch_size=500, interval=60, idle_retry=15):
+        self.journal = journal
+        self.api = api
+        self.schedule = schedule
+        self.is_idle = is_idle
+        self.device_id = device_id
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.interval = interval
+        self.idle_retry = idle_retry
+        self.retry_delay = interval
+        self.uploaded = 0
+        self.busy = False
+        self._handle = None
+
+    def start(self, delay=None):
+        self._reschedule(self.interval if delay is None else delay)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _reschedule(self, delay):
+        self.stop()
+        self._handle = self.schedule(delay, self.tick)
+
+    def tick(self, *args):
+        self._handle = None
+        if self.busy:
+            return
+        if self.is_idle and not self.is_idle():
+            self._reschedule(self.idle_retry)
+            return
+        rows = self.journal.next_batch(self.batch_size)
+        if not rows:
+            self._reschedule(self.interval)
+            return
+        self.busy = True
+        first, last = rows[0][0], rows[-1][0]
+        # Rows are unique on (install, seq) for servers that dedupe per row;
+        # the key covers the frozen batch for those that dedupe per request.
+        install = self.journal.install_id
+        body = gzip.compress(json.dumps({'device': self.device_id, 'install': install, 'columns': COLUMNS, 'rows': rows}, separators=(',', ':')).encode('utf-8'))
+        headers = {'Content-type': 'application/json', 'Content-Encoding': 'gzip', 'Idempotency-Key': f'{install}:{first}-{last}'}
+        self.api.request(self.endpoint, 'POST', body, headers, on_success=lambda req, res: self._on_sent(last, len(rows)), on_failure=self._on_failed)
+
+    def _on_sent(self, last, count):
+        self.journal.mark_uploaded(last)
+        self.uploaded += count
+        self.busy = False
+        self.retry_delay = self.interval
+        self._reschedule(0 if count >= self.batch_size else self.interval)
+
+    def _on_failed(self, req, err):
+        self.busy = False
+        status = getattr(req, 'resp_status', None)
+        if status in (404, 405):
+            self.retry_delay = self.RETRY_MAX
+        else:
+            self.retry_delay = min(self.retry_delay * 2, self.RETRY_MAX)
+        self._reschedule(self.retry_delay)
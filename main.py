@@ -1,28 +1,32 @@
-from datetime import datetime
+from collections import OrderedDict
 from functools import partial
 import hashlib
 import json
 import os
 import socket
 import sys
+import threading
+import time
 import traceback
+
+from applog import AsyncLogger
 # ============================================
+_startup_mark = time.perf_counter()
+startup_phases = []
+
+def mark_startup(phase):
+    global _startup_mark
+    now = time.perf_counter()
+    startup_phases.append((phase, (now - _startup_mark) * 1000))
+    _startup_mark = now
+
 log_file = 'scale_log.txt'
-if os.path.exists(log_file):
-    try:
-        os.remove(log_file)
-    except:
-        pass
+logger = AsyncLogger(log_file, level=os.environ.get('SCALE_LOG_LEVEL', 'INFO'))
 
-def log_msg(msg, level='INFO'):
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    formatted_msg = f'[{timestamp}] [{level}] {msg}\n'
-    print(formatted_msg)
-    try:
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(formatted_msg)
-    except:
-        pass
+def log_msg(msg, *args, level='INFO'):
+    # Pass values as %-style args: they are only formatted, on the writer
+    # thread, when the level is enabled.
+    logger.log(level, msg, *args)
 
 # ============================================
 def get_device_id_s():
@@ -53,33 +57,33 @@ try:
     from kivy.core.window import Window
     from kivy.lang import Builder
     from kivy.clock import Clock
-    from kivy.properties import StringProperty, ObjectProperty, BooleanProperty
-    from kivy.network.urlrequest import UrlRequest
+    from kivy.properties import StringProperty, ObjectProperty, BooleanProperty, NumericProperty
     from kivy.storage.jsonstore import JsonStore
     from kivy.utils import platform
-    from kivy.core.clipboard import Clipboard
-    from kivy.metrics import dp
-    from kivy.uix.recycleview import RecycleView
+    from kivy.core.image import Image as CoreImage
+    from kivy.metrics import dp, sp
+    from kivy.graphics import Color, Rectangle, RoundedRectangle
+    from kivy.uix.widget import Widget
     from kivy.uix.recycleview.views import RecycleDataViewBehavior
     from kivymd.app import MDApp
     from kivymd.uix.screen import MDScreen
     from kivymd.uix.screenmanager import MDScreenManager
     from kivymd.uix.boxlayout import MDBoxLayout
-    from kivymd.uix.floatlayout import MDFloatLayout
-    from kivymd.uix.card import MDCard
-    from kivymd.uix.button import MDRaisedButton, MDFlatButton, MDIconButton, MDFillRoundFlatButton
-    from kivymd.uix.label import MDLabel, MDIcon
     from kivymd.uix.textfield import MDTextField
-    from kivymd.uix.dialog import MDDialog
-    from kivymd.uix.list import MDList, OneLineIconListItem, TwoLineIconListItem, IconLeftWidget
-    from kivymd.uix.scrollview import MDScrollView
-    from kivymd.uix.bottomnavigation import MDBottomNavigation, MDBottomNavigationItem
-    from kivy.core.text import LabelBase
-    import arabic_reshaper
-    from bidi.algorithm import get_display
+    from kivy.core.text import LabelBase, Label as CoreLabel
+    from shaping import get_shaper
+    from images import DiskImageCache, ImageLoader, image_filename
+    from discovery import ServerDiscovery
+    from journal import JournalUploader, SalesJournal, entries_from_payload
+    from net import ApiClient, ConnectivityMonitor, EndpointManager, EventStream, HttpClient
+    from printing import DirectPrinter, LabelRenderer, PrintOutbox, RawPrinter, compute_total_cents, format_cents, parse_size, to_cents
+    from scale_input import StabilityFilter, StableTrigger, WeightStream, open_source
+    from catalog import CatalogStore, CatalogSync, PluIndex, QueryRunner, RowCache, SearchIndex, normalize_product, rank_by_usage, stream_catalog
+    from telemetry import Telemetry
 except Exception as e:
-    log_msg(f'Import Error: {traceback.format_exc()}', 'CRITICAL')
+    log_msg('Import Error: %s', traceback.format_exc(), level='CRITICAL')
     sys.exit(1)
+mark_startup('imports')
 # ============================================
 class SmartTextField(MDTextField):
 
@@ -87,7 +91,7 @@ class SmartTextField(MDTextField):
         self._raw_text = ''
         self.base_direction = 'ltr'
         self.halign = 'left'
-        self._input_reshaper = arabic_reshaper.ArabicReshaper(configuration={'delete_harakat': True, 'support_ligatures': False, 'use_unshaped_instead_of_isolated': True})
+        self._shaper = get_shaper('input')
         super().__init__(**kwargs)
         self.font_name = 'AppFont'
         self.font_name_hint_text = 'AppFont'
@@ -113,12 +117,7 @@ class SmartTextField(MDTextField):
 
     def _update_display(self):
         if self._raw_text:
-            try:
-                reshaped = self._input_reshaper.reshape(self._raw_text)
-                bidi_text = get_display(reshaped)
-                self.text = bidi_text
-            except Exception:
-                self.text = self._raw_text
+            self.text = self._shaper.shape_live(self._raw_text)
         else:
             self.text = ''
         self._update_alignment(self._raw_text)
@@ -151,13 +150,59 @@ class SmartTextField(MDTextField):
         pass
 
 # ============================================
-KV_BUILDER = '\n<ProductItem>:\n    orientation: \'vertical\'\n    size_hint_y: None\n    height: dp(100)\n    padding: [dp(10), dp(5)]\n    \n    MDCard:\n        orientation: \'horizontal\'\n        radius: [15]\n        elevation: 2\n        ripple_behavior: True\n        on_release: root.on_tap()\n        md_bg_color: 1, 1, 1, 1\n        padding: dp(10)\n        spacing: dp(15)\n\n        MDFloatLayout:\n            size_hint: None, None\n            size: dp(70), dp(70)\n            pos_hint: {\'center_y\': .5}\n            \n            MDCard:\n                radius: [10]\n                md_bg_color: 0.95, 0.95, 0.95, 1\n                size_hint: 1, 1\n                pos_hint: {\'center_x\': .5, \'center_y\': .5}\n                elevation: 0\n\n            FitImage:\n                source: root.image_url\n                radius: [10]\n                mipmap: True\n                pos_hint: {\'center_x\': .5, \'center_y\': .5}\n                opacity: 1 if root.image_url else 0\n                \n            MDIcon:\n                icon: "scale"\n                halign: "center"\n                font_size: "36sp"\n                theme_text_color: "Hint"\n                pos_hint: {\'center_x\': .5, \'center_y\': .5}\n                opacity: 0 if root.image_url else 1\n\n        MDBoxLayout:\n            orientation: \'vertical\'\n            pos_hint: {\'center_y\': .5}\n            adaptive_height: True\n            spacing: dp(5)\n            \n            MDLabel:\n                text: root.text_name\n                font_style: \'Subtitle1\'\n                bold: True\n                theme_text_color: "Custom"\n                text_color: 0.2, 0.2, 0.2, 1\n                font_name: "AppFont"\n                halign: "left"\n                adaptive_height: True\n                text_size: self.width, None\n                max_lines: 2\n                line_height: 1.1\n            \n            MDLabel:\n                text: root.text_price\n                font_style: \'H6\'\n                theme_text_color: "Custom"\n                text_color: 0, 0.7, 0, 1\n                bold: True\n                font_name: "AppFont"\n                halign: "left"\n                adaptive_height: True\n\n<LoginScreen>:\n    name: \'login\'\n    \n    MDFloatLayout:\n        md_bg_color: 0.98, 0.98, 0.98, 1\n        \n        MDBoxLayout:\n            orientation: \'horizontal\'\n            adaptive_size: True\n            pos_hint: {\'top\': 0.98, \'right\': 0.98}\n            spacing: dp(5)\n            padding: dp(10)\n            \n            MDIcon:\n                icon: \'circle\'\n                theme_text_color: "Custom"\n                text_color: (0, 0.8, 0, 1) if app.is_connected else (0.8, 0, 0, 1)\n                font_size: "14sp"\n                pos_hint: {\'center_y\': 0.5}\n                \n            MDIconButton:\n                icon: \'cog\'\n                on_release: app.open_settings_dialog()\n\n        MDBoxLayout:\n            orientation: \'vertical\'\n            size_hint: 0.85, None\n            height: dp(450)\n            pos_hint: {\'center_x\': 0.5, \'center_y\': 0.5}\n            spacing: dp(20)\n            \n            MDIcon:\n                icon: \'scale-balance\'\n                font_size: \'90sp\'\n                halign: \'center\'\n                theme_text_color: "Primary"\n            \n            MDLabel:\n                text: "MagPro Scale"\n                halign: \'center\'\n                font_style: "H4"\n                bold: True\n                font_name: "AppFont"\n                \n            SmartTextField:\n                id: user_field\n                text: "ADMIN"\n                hint_text: "Utilisateur"\n                icon_right: "account"\n                mode: "fill"\n                font_name: "AppFont"\n                radius: [10, 10, 0, 0]\n\n            SmartTextField:\n                id: pass_field\n                hint_text: "Mot de passe"\n                password: True\n                icon_right: "key"\n                mode: "fill"\n                font_name: "AppFont"\n                radius: [0, 0, 10, 10]\n\n            MDRaisedButton:\n                text: "SE CONNECTER"\n                font_size: "18sp"\n                size_hint_x: 1\n                height: dp(55)\n                font_name: "AppFont"\n                md_bg_color: app.theme_cls.primary_color\n                on_release: app.do_login(user_field.get_value(), pass_field.get_value())\n\n            MDLabel:\n                text: "MagPro Scale v7.1.0 © 2026"\n                halign: \'center\'\n                font_style: "Caption"\n                theme_text_color: "Hint"\n                font_name: "AppFont"\n                size_hint_y: None\n                height: dp(20)\n\n<MainScaleScreen>:\n    name: \'scale\'\n    \n    MDBottomNavigation:\n        id: bottom_nav\n        selected_color_background: "blue"\n        text_color_active: 0, 0, 0, 1\n        font_name: "AppFont"\n\n        MDBottomNavigationItem:\n            name: \'screen_products\'\n            text: \'Produits\'\n            icon: \'package-variant\'\n            \n            MDBoxLayout:\n                orientation: \'vertical\'\n                md_bg_color: 0.98, 0.98, 0.98, 1\n                \n                MDBoxLayout:\n                    size_hint_y: None\n                    height: dp(70)\n                    padding: [dp(10), dp(5)]\n                    spacing: dp(10)\n                    md_bg_color: 1, 1, 1, 1\n                    elevation: 1\n                    \n                    MDIconButton:\n                        icon: \'logout\'\n                        theme_text_color: "Error"\n                        on_release: app.logout()\n                        pos_hint: {\'center_y\': 0.5}\n                        \n                    SmartTextField:\n                        id: search_box\n                        hint_text: "Rechercher..."\n                        mode: "rectangle"\n                        icon_right: "magnify"\n                        font_name: "AppFont"\n                        size_hint_y: None\n                        height: dp(45)\n                        pos_hint: {\'center_y\': 0.5}\n                        on_text: app.filter_products(self.get_value())\n                        \n                    MDIcon:\n                        icon: \'circle\'\n                        theme_text_color: "Custom"\n                        text_color: (0, 0.8, 0, 1) if app.is_connected else (0.8, 0, 0, 1)\n                        font_size: "16sp"\n                        pos_hint: {\'center_y\': 0.5}\n\n                RecycleView:\n                    id: rv\n                    viewclass: \'ProductItem\'\n                    bar_width: dp(0)\n                    \n                    RecycleBoxLayout:\n                        default_size: None, dp(100)\n                        default_size_hint: 1, None\n                        size_hint_y: None\n                        height: self.minimum_height\n                        orientation: \'vertical\'\n                        spacing: dp(2)\n                        padding: [0, dp(10), 0, dp(80)]\n\n        MDBottomNavigationItem:\n            name: \'screen_weigh\'\n            text: \'Balance\'\n            icon: \'scale\'\n            \n            MDBoxLayout:\n                orientation: \'vertical\'\n                spacing: dp(10)\n                padding: dp(15)\n                md_bg_color: 0.98, 0.98, 0.98, 1\n                \n                MDCard:\n                    orientation: \'vertical\'\n                    size_hint_y: None\n                    height: dp(140)\n                    padding: dp(15)\n                    radius: [15]\n                    elevation: 1\n                    md_bg_color: 1, 1, 1, 1\n                    \n                    MDLabel:\n                        text: "PRODUIT SÉLECTIONNÉ"\n                        halign: \'center\'\n                        font_style: \'Overline\'\n                        font_name: "AppFont"\n                        theme_text_color: \'Secondary\'\n                        size_hint_y: None\n                        height: dp(20)\n                        \n                    MDLabel:\n                        id: lbl_name\n                        text: "---"\n                        halign: \'center\'\n                        font_style: \'H5\'\n                        bold: True\n                        font_name: "AppFont"\n                        theme_text_color: "Primary"\n                        shorten: True\n                        size_hint_y: 1\n                        \n                    MDBoxLayout:\n                        size_hint_y: None\n                        height: dp(30)\n                        MDLabel:\n                            text: "PRIX / KG:"\n                            font_name: "AppFont"\n                            halign: \'left\'\n                            font_style: \'Body2\'\n                        MDLabel:\n                            id: lbl_price_unit\n                            text: "0.00 DA"\n                            halign: \'right\'\n                            bold: True\n                            theme_text_color: "Custom"\n                            text_color: 0, 0.6, 0, 1\n                            font_size: "18sp"\n\n                MDGridLayout:\n                    cols: 2\n                    spacing: dp(10)\n                    size_hint_y: None\n                    height: dp(80)\n\n                    MDCard:\n                        padding: dp(5)\n                        radius: [10]\n                        md_bg_color: 1, 1, 1, 1\n                        MDTextField:\n                            id: txt_weight\n                            hint_text: "POIDS (g)"\n                            font_size: "26sp"\n                            halign: \'center\'\n                            input_filter: \'int\'\n                            mode: "line"\n                            line_color_normal: 0,0,0,0\n                            line_color_focus: 0,0,0,0\n                            readonly: True\n                            font_name: "AppFont"\n\n                    MDCard:\n                        padding: dp(10)\n                        radius: [10]\n                        md_bg_color: 0.1, 0.1, 0.1, 1\n                        MDBoxLayout:\n                            orientation: \'vertical\'\n                            MDLabel:\n                                text: "TOTAL"\n                                color: 1, 1, 1, 0.7\n                                font_style: \'Caption\'\n                                halign: \'center\'\n                            MDLabel:\n                                id: lbl_total\n                                text: "0.00"\n                                halign: \'center\'\n                                color: 0, 1, 0, 1\n                                font_style: \'H5\'\n                                bold: True\n\n                MDGridLayout:\n                    cols: 3\n                    spacing: dp(8)\n                    size_hint_y: 1\n                    \n                    MDRaisedButton:\n                        text: "7"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("7")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "8"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("8")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "9"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("9")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                        \n                    MDRaisedButton:\n                        text: "4"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("4")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "5"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("5")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "6"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("6")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                        \n                    MDRaisedButton:\n                        text: "1"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("1")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "2"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("2")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "3"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("3")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                        \n                    MDRaisedButton:\n                        text: "C"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        md_bg_color: 0.9, 0.9, 0.9, 1\n                        text_color: 0.8, 0, 0, 1\n                        on_release: app.clear_weight()\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "0"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("0")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDIconButton:\n                        icon: "backspace"\n                        size_hint: 1, 1\n                        icon_size: "30sp"\n                        on_release: app.backspace()\n                        theme_text_color: "Custom"\n                        text_color: 0.3, 0.3, 0.3, 1\n\n                MDFillRoundFlatButton:\n                    text: "IMPRIMER"\n                    font_name: "AppFont"\n                    font_size: "20sp"\n                    size_hint_x: 1\n                    height: dp(55)\n                    md_bg_color: 0, 0.7, 0, 1\n                    on_release: app.send_print_command()\n'
+KV_LOGIN = '\n<LoginScreen>:\n    name: \'login\'\n    \n    MDFloatLayout:\n        md_bg_color: 0.98, 0.98, 0.98, 1\n        \n        MDBoxLayout:\n            orientation: \'horizontal\'\n            adaptive_size: True\n            pos_hint: {\'top\': 0.98, \'right\': 0.98}\n            spacing: dp(5)\n            padding: dp(10)\n            \n            MDIcon:\n                icon: \'circle\'\n                theme_text_color: "Custom"\n                text_color: (0, 0.8, 0, 1) if app.is_connected else (0.8, 0, 0, 1)\n                font_size: "14sp"\n                pos_hint: {\'center_y\': 0.5}\n                \n            MDIconButton:\n                icon: \'cog\'\n                on_release: app.open_settings_dialog()\n\n        MDBoxLayout:\n            orientation: \'vertical\'\n            size_hint: 0.85, None\n            height: dp(450)\n            pos_hint: {\'center_x\': 0.5, \'center_y\': 0.5}\n            spacing: dp(20)\n            \n            MDIcon:\n                icon: \'scale-balance\'\n                font_size: \'90sp\'\n                halign: \'center\'\n                theme_text_color: "Primary"\n            \n            MDLabel:\n                text: "MagPro Scale"\n                halign: \'center\'\n                font_style: "H4"\n                bold: True\n                font_name: "AppFont"\n                \n            SmartTextField:\n                id: user_field\n                text: "ADMIN"\n                hint_text: "Utilisateur"\n                icon_right: "account"\n                mode: "fill"\n                font_name: "AppFont"\n                radius: [10, 10, 0, 0]\n\n            SmartTextField:\n                id: pass_field\n                hint_text: "Mot de passe"\n                password: True\n                icon_right: "key"\n                mode: "fill"\n                font_name: "AppFont"\n                radius: [0, 0, 10, 10]\n\n            MDRaisedButton:\n                text: "SE CONNECTER"\n                font_size: "18sp"\n                size_hint_x: 1\n                height: dp(55)\n                font_name: "AppFont"\n                md_bg_color: app.theme_cls.primary_color\n                on_release: app.do_login(user_field.get_value(), pass_field.get_value())\n\n            MDLabel:\n                text: "MagPro Scale v7.1.0 © 2026"\n                halign: \'center\'\n                font_style: "Caption"\n                theme_text_color: "Hint"\n                font_name: "AppFont"\n                size_hint_y: None\n                height: dp(20)\n'
+
+KV_MAIN = '\n<ProductThumb>:\n    canvas:\n        Color:\n            rgba: 1, 1, 1, 1 if self.texture else 0\n        RoundedRectangle:\n            pos: self.pos\n            size: self.size\n            radius: [10]\n            texture: self.texture\n\n<ProductItem>:\n    orientation: \'vertical\'\n    size_hint_y: None\n    height: dp(100)\n    padding: [dp(10), dp(5)]\n    \n    MDCard:\n        orientation: \'horizontal\'\n        radius: [15]\n        elevation: 2\n        ripple_behavior: True\n        on_release: root.on_tap()\n        md_bg_color: 1, 1, 1, 1\n        padding: dp(10)\n        spacing: dp(15)\n\n        MDFloatLayout:\n            size_hint: None, None\n            size: dp(70), dp(70)\n            pos_hint: {\'center_y\': .5}\n            \n            MDCard:\n                radius: [10]\n                md_bg_color: 0.95, 0.95, 0.95, 1\n                size_hint: 1, 1\n                pos_hint: {\'center_x\': .5, \'center_y\': .5}\n                elevation: 0\n\n            ProductThumb:\n                texture: root.image_texture\n                pos_hint: {\'center_x\': .5, \'center_y\': .5}\n                opacity: 1 if root.image_url else 0\n                \n            MDIcon:\n                icon: "scale"\n                halign: "center"\n                font_size: "36sp"\n                theme_text_color: "Hint"\n                pos_hint: {\'center_x\': .5, \'center_y\': .5}\n                opacity: 0 if root.image_url else 1\n\n        MDBoxLayout:\n            orientation: \'vertical\'\n            pos_hint: {\'center_y\': .5}\n            adaptive_height: True\n            spacing: dp(5)\n            \n            MDLabel:\n                text: root.text_name\n                font_style: \'Subtitle1\'\n                bold: True\n                theme_text_color: "Custom"\n                text_color: 0.2, 0.2, 0.2, 1\n                font_name: "AppFont"\n                halign: "left"\n                adaptive_height: True\n                text_size: self.width, None\n                max_lines: 2\n                line_height: 1.1\n            \n            MDLabel:\n                text: root.text_price\n                font_style: \'H6\'\n                theme_text_color: "Custom"\n                text_color: 0, 0.7, 0, 1\n                bold: True\n                font_name: "AppFont"\n                halign: "left"\n                adaptive_height: True\n\n<MainScaleScreen>:\n    name: \'scale\'\n    \n    MDBottomNavigation:\n        id: bottom_nav\n        selected_color_background: "blue"\n        text_color_active: 0, 0, 0, 1\n        font_name: "AppFont"\n\n        MDBottomNavigationItem:\n            name: \'screen_products\'\n            text: \'Produits\'\n            icon: \'package-variant\'\n            \n            MDBoxLayout:\n                orientation: \'vertical\'\n                md_bg_color: 0.98, 0.98, 0.98, 1\n                \n                MDBoxLayout:\n                    size_hint_y: None\n                    height: dp(70)\n                    padding: [dp(10), dp(5)]\n                    spacing: dp(10)\n                    md_bg_color: 1, 1, 1, 1\n                    elevation: 1\n                    \n                    MDIconButton:\n                        icon: \'logout\'\n                        theme_text_color: "Error"\n                        on_release: app.logout()\n                        pos_hint: {\'center_y\': 0.5}\n                        \n                    SmartTextField:\n                        id: search_box\n                        hint_text: "Rechercher..."\n                        mode: "rectangle"\n                        icon_right: "magnify"\n                        font_name: "AppFont"\n                        size_hint_y: None\n                        height: dp(45)\n                        pos_hint: {\'center_y\': 0.5}\n                        on_text: app.filter_products(self.get_value())\n                        \n                    MDIcon:\n                        icon: \'circle\'\n                        theme_text_color: "Custom"\n                        text_color: (0, 0.8, 0, 1) if app.is_connected else (0.8, 0, 0, 1)\n                        font_size: "16sp"\n                        pos_hint: {\'center_y\': 0.5}\n\n                RecycleView:\n                    id: rv\n                    viewclass: \'ProductItem\'\n                    bar_width: dp(0)\n                    \n                    RecycleBoxLayout:\n                        default_size: None, dp(100)\n                        default_size_hint: 1, None\n                        size_hint_y: None\n                        height: self.minimum_height\n                        orientation: \'vertical\'\n                        spacing: dp(2)\n                        padding: [0, dp(10), 0, dp(80)]\n\n        MDBottomNavigationItem:\n            name: \'screen_weigh\'\n            text: \'Balance\'\n            icon: \'scale\'\n            \n            MDBoxLayout:\n                orientation: \'vertical\'\n                spacing: dp(10)\n                padding: dp(15)\n                md_bg_color: 0.98, 0.98, 0.98, 1\n                \n                MDCard:\n                    orientation: \'vertical\'\n                    size_hint_y: None\n                    height: dp(140)\n                    padding: dp(15)\n                    radius: [15]\n                    elevation: 1\n                    md_bg_color: 1, 1, 1, 1\n                    \n                    MDLabel:\n                        text: "PRODUIT SÉLECTIONNÉ"\n                        halign: \'center\'\n                        font_style: \'Overline\'\n                        font_name: "AppFont"\n                        theme_text_color: \'Secondary\'\n                        size_hint_y: None\n                        height: dp(20)\n                        \n                    MDLabel:\n                        id: lbl_name\n                        text: "---"\n                        halign: \'center\'\n                        font_style: \'H5\'\n                        bold: True\n                        font_name: "AppFont"\n                        theme_text_color: "Primary"\n                        shorten: True\n                        size_hint_y: 1\n                        \n                    MDBoxLayout:\n                        size_hint_y: None\n                        height: dp(30)\n                        MDLabel:\n                            text: "PRIX / KG:"\n                            font_name: "AppFont"\n                            halign: \'left\'\n                            font_style: \'Body2\'\n                        MDLabel:\n                            id: lbl_price_unit\n                            text: "0.00 DA"\n                            halign: \'right\'\n                            bold: True\n                            theme_text_color: "Custom"\n                            text_color: 0, 0.6, 0, 1\n                            font_size: "18sp"\n\n                ScrollView:\n                    size_hint_y: None\n                    height: dp(44) if app.has_favorites else 0\n                    opacity: 1 if app.has_favorites else 0\n                    do_scroll_y: False\n                    bar_width: 0\n\n                    MDBoxLayout:\n                        id: favorites_box\n                        orientation: \'horizontal\'\n                        adaptive_width: True\n                        spacing: dp(6)\n\n                MDGridLayout:\n                    cols: 2\n                    spacing: dp(10)\n                    size_hint_y: None\n                    height: dp(80)\n\n                    MDCard:\n                        padding: dp(5)\n                        radius: [10]\n                        md_bg_color: 1, 1, 1, 1\n                        MDTextField:\n                            id: txt_weight\n                            hint_text: "POIDS (g)"\n                            font_size: "26sp"\n                            halign: \'center\'\n                            input_filter: \'int\'\n                            mode: "line"\n                            line_color_normal: 0,0,0,0\n                            line_color_focus: 0,0,0,0\n                            readonly: True\n                            font_name: "AppFont"\n\n                    MDCard:\n                        padding: dp(10)\n                        radius: [10]\n                        md_bg_color: 0.1, 0.1, 0.1, 1\n                        MDBoxLayout:\n                            orientation: \'vertical\'\n                            MDLabel:\n                                text: "TOTAL"\n                                color: 1, 1, 1, 0.7\n                                font_style: \'Caption\'\n                                halign: \'center\'\n                            MDLabel:\n                                id: lbl_total\n                                text: "0.00"\n                                halign: \'center\'\n                                color: (0, 1, 0, 1) if app.weight_stable or not app.live_weight else (1, 0.7, 0, 1)\n                                font_style: \'H5\'\n                                bold: True\n\n                MDGridLayout:\n                    cols: 3\n                    spacing: dp(8)\n                    size_hint_y: 1\n                    \n                    MDRaisedButton:\n                        text: "7"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("7")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "8"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("8")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "9"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("9")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                        \n                    MDRaisedButton:\n                        text: "4"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("4")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "5"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("5")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "6"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("6")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                        \n                    MDRaisedButton:\n                        text: "1"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("1")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "2"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("2")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "3"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("3")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                        \n                    MDRaisedButton:\n                        text: "C"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        md_bg_color: 0.9, 0.9, 0.9, 1\n                        text_color: 0.8, 0, 0, 1\n                        on_release: app.clear_weight()\n                        elevation: 1\n                    MDRaisedButton:\n                        text: "0"\n                        font_size: "24sp"\n                        size_hint: 1, 1\n                        on_release: app.add_digit("0")\n                        md_bg_color: 1, 1, 1, 1\n                        text_color: 0, 0, 0, 1\n                        elevation: 1\n                    MDIconButton:\n                        icon: "backspace"\n                        size_hint: 1, 1\n                        icon_size: "30sp"\n                        on_release: app.backspace()\n                        theme_text_color: "Custom"\n                        text_color: 0.3, 0.3, 0.3, 1\n\n                MDBoxLayout:\n                    size_hint_y: None\n                    height: dp(48)\n                    spacing: dp(8)\n\n                    MDIconButton:\n                        icon: "minus"\n                        on_release: app.change_copies(-1)\n                        pos_hint: {\'center_y\': 0.5}\n                    MDLabel:\n                        text: "x{}".format(app.label_copies)\n                        halign: \'center\'\n                        font_style: \'H6\'\n                        bold: True\n                        size_hint_x: None\n                        width: dp(50)\n                    MDIconButton:\n                        icon: "plus"\n                        on_release: app.change_copies(1)\n                        pos_hint: {\'center_y\': 0.5}\n                    MDRaisedButton:\n                        text: "AJOUTER AU LOT"\n                        font_name: "AppFont"\n                        size_hint_x: 1\n                        pos_hint: {\'center_y\': 0.5}\n                        md_bg_color: 0.2, 0.4, 0.8, 1\n                        on_release: app.add_to_batch()\n\n                MDLabel:\n                    text: app.batch_status\n                    halign: \'center\'\n                    font_style: \'Caption\'\n                    font_name: "AppFont"\n                    theme_text_color: \'Secondary\'\n                    size_hint_y: None\n                    height: dp(20) if app.batch_status else 0\n                    opacity: 1 if app.batch_status else 0\n\n                MDFillRoundFlatButton:\n                    text: "IMPRIMER" if not app.pending_prints else "IMPRIMER  ({} en attente)".format(app.pending_prints)\n                    font_name: "AppFont"\n                    font_size: "20sp"\n                    size_hint_x: 1\n                    height: dp(55)\n                    md_bg_color: 0, 0.7, 0, 1\n                    on_release: app.send_print_command()\n'
 # ============================================
+def run_on_ui(fn):
+    Clock.schedule_once(lambda dt: fn(), 0)
+
+class TextureCache:
+
+    def __init__(self, budget_bytes=48 * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.used_bytes = 0
+        self._items = OrderedDict()
+
+    def get(self, path):
+        if not path:
+            return None
+        entry = self._items.get(path)
+        if entry is not None:
+            self._items.move_to_end(path)
+            return entry[0]
+        try:
+            texture = CoreImage(path, mipmap=True, nocache=True).texture
+        except Exception as e:
+            log_msg('Texture load error %s: %s', path, e, level='WARNING')
+            return None
+        size = texture.width * texture.height * 4 * 4 // 3
+        side = min(texture.width, texture.height)
+        if texture.width != texture.height:
+            texture = texture.get_region((texture.width - side) // 2, (texture.height - side) // 2, side, side)
+        self._items[path] = (texture, size)
+        self.used_bytes += size
+        while self.used_bytes > self.budget_bytes and len(self._items) > 1:
+            _, (_, old_size) = self._items.popitem(last=False)
+            self.used_bytes -= old_size
+        return texture
+
+    def discard(self, path):
+        entry = self._items.pop(path, None)
+        if entry:
+            self.used_bytes -= entry[1]
+
+texture_cache = TextureCache()
+
+class ProductThumb(Widget):
+    texture = ObjectProperty(None, allownone=True)
+
 class ProductItem(RecycleDataViewBehavior, MDBoxLayout):
     index = None
     text_name = StringProperty('')
     text_price = StringProperty('')
     image_url = StringProperty('')
+    image_texture = ObjectProperty(None, allownone=True)
     product_data = ObjectProperty(None)
 
     def refresh_view_attrs(self, rv, index, data):
@@ -165,12 +210,137 @@ class ProductItem(RecycleDataViewBehavior, MDBoxLayout):
         self.text_name = data.get('text_name', '')
         self.text_price = data.get('text_price', '')
         self.image_url = data.get('image_url', '')
+        self.image_texture = texture_cache.get(self.image_url)
         self.product_data = data.get('product_data')
+        MDApp.get_running_app().request_row_images(rv, index)
         return super().refresh_view_attrs(rv, index, data)
 
     def on_tap(self):
         MDApp.get_running_app().select_product(self.product_data)
 
+class LabelTextureCache:
+    # Rendered text is reused across recycled rows, so scrolling back over
+    # a product does not lay its name out again.
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, text, font_name='AppFont', **options):
+        key = (text, font_name, tuple(sorted(options.items())))
+        texture = self._items.get(key)
+        if texture is not None:
+            self._items.move_to_end(key)
+            return texture
+        label = CoreLabel(text=text, font_name=font_name, **options)
+        label.refresh()
+        texture = self._items[key] = label.texture
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+        return texture
+
+    def clear(self):
+        self._items.clear()
+
+label_textures = LabelTextureCache()
+
+class FastProductItem(RecycleDataViewBehavior, Widget):
+    # Same data and tap contract as ProductItem, drawn as a handful of
+    # canvas instructions: no child widgets, no shadows, no relayout.
+    index = None
+    product_data = None
+    image_url = ''
+    pressed = False
+    placeholder_glyph = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.text_name = ''
+        self.text_price = ''
+        with self.canvas:
+            self._bg_color = Color(1, 1, 1, 1)
+            self._bg = RoundedRectangle(radius=[dp(12)])
+            Color(0.95, 0.95, 0.95, 1)
+            self._thumb_bg = RoundedRectangle(radius=[dp(10)])
+            Color(1, 1, 1, 1)
+            self._thumb = RoundedRectangle(radius=[dp(10)])
+            Color(1, 1, 1, 1)
+            self._name = Rectangle()
+            self._price = Rectangle()
+        self.bind(pos=self._layout, size=self._layout)
+
+    @classmethod
+    def placeholder(cls):
+        # The icon table is a large module; load it on the first row drawn
+        # rather than at startup.
+        if cls.placeholder_glyph is None:
+            from kivymd.icon_definitions import md_icons
+            cls.placeholder_glyph = md_icons['scale']
+        return cls.placeholder_glyph
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.index = index
+        self.product_data = data.get('product_data')
+        self.image_url = data.get('image_url', '')
+        self.text_name = data.get('text_name', '')
+        self.text_price = data.get('text_price', '')
+        MDApp.get_running_app().request_row_images(rv, index)
+        super().refresh_view_attrs(rv, index, data)
+        self._layout()
+
+    def _layout(self, *args):
+        x, y = self.pos
+        w, h = self.size
+        pad = dp(10)
+        self._bg.pos = (x + pad, y + dp(5))
+        self._bg.size = (max(0, w - 2 * pad), max(0, h - dp(10)))
+        side = dp(70)
+        tx, ty = x + 2 * pad, y + (h - side) / 2
+        self._thumb_bg.pos = (tx, ty)
+        self._thumb_bg.size = (side, side)
+        texture = texture_cache.get(self.image_url)
+        if texture is not None:
+            self._thumb.texture = texture
+            self._thumb.size = (side, side)
+            self._thumb.pos = (tx, ty)
+        else:
+            icon = label_textures.get(self.placeholder(), font_name='Icons', font_size=sp(36), color=(0.6, 0.6, 0.6, 1))
+            self._thumb.texture = icon
+            self._thumb.size = icon.size
+            self._thumb.pos = (tx + (side - icon.width) / 2, ty + (side - icon.height) / 2)
+        left = tx + side + dp(15)
+        width = max(1, int(x + w - 2 * pad - left))
+        name = label_textures.get(self.text_name, font_size=sp(16), bold=True, color=(0.2, 0.2, 0.2, 1), text_size=(width, None), max_lines=2, shorten=True, shorten_from='right', halign='left')
+        price = label_textures.get(self.text_price, font_size=sp(20), bold=True, color=(0, 0.7, 0, 1))
+        block = name.height + dp(5) + price.height
+        top = y + (h + block) / 2
+        self._name.texture = name
+        self._name.size = name.size
+        self._name.pos = (left, top - name.height)
+        self._price.texture = price
+        self._price.size = price.size
+        self._price.pos = (left, top - block)
+
+    def on_touch_down(self, touch):
+        if self.collide_point(*touch.pos):
+            touch.ud['product_row'] = self
+            self._bg_color.rgba = (0.93, 0.93, 0.93, 1)
+            return True
+        return super().on_touch_down(touch)
+
+    def on_touch_move(self, touch):
+        if touch.ud.get('product_row') is self and not self.collide_point(*touch.pos):
+            self._bg_color.rgba = (1, 1, 1, 1)
+        return super().on_touch_move(touch)
+
+    def on_touch_up(self, touch):
+        if touch.ud.get('product_row') is self:
+            self._bg_color.rgba = (1, 1, 1, 1)
+            if self.collide_point(*touch.pos):
+                MDApp.get_running_app().select_product(self.product_data)
+                return True
+        return super().on_touch_up(touch)
+
 class LoginScreen(MDScreen):
     pass
 
@@ -179,7 +349,14 @@ class MainScaleScreen(MDScreen):
 
 class ScaleApp(MDApp):
     is_connected = BooleanProperty(False)
+    pending_prints = NumericProperty(0)
+    label_copies = NumericProperty(1)
+    batch_status = StringProperty('')
+    live_weight = BooleanProperty(False)
+    weight_stable = BooleanProperty(False)
+    has_favorites = BooleanProperty(False)
     selected_product = None
+    price_cents = 0
     all_products = []
     dialog = None
     dialog_loading = None
@@ -188,12 +365,66 @@ class ScaleApp(MDApp):
     ethernet_ip = ''
     server_port = '5000'
     sticker_size = '40x20'
+    direct_print = False
+    printer_ip = ''
+    printer_port = 9100
+    printer_language = 'tspl'
+    telemetry = None
+    telemetry_enabled = False
+    frame_event = None
+    fast_rows = False
+    scale_source = ''
+    auto_print = False
+    weight_stream = None
+    weight_event = None
+    weight_seq = 0
+    weight_trigger = None
+    weight_poll_rate = 15
     available_ips = []
-    current_ip_index = 0
+    endpoints = None
+    discovery = None
+    discovered = []
+    discovery_running = False
+    discovery_event = None
+    discovery_retry = 5
+    discovery_retry_max = 60
+    discovery_keep = 4
+    api = None
     license_store = None
-    cache_store = None
+    catalog_store = None
+    catalog_sync = None
     activation_dialog_ref = None
-    heartbeat_event = None
+    monitor = None
+    print_outbox = None
+    print_batch = []
+    journal = None
+    journal_uploader = None
+    last_activity = 0
+    idle_after = 30
+    max_copies = 99
+    http = None
+    image_cache = None
+    image_loader = None
+    image_prefetch = 4
+    search_index = None
+    row_cache = None
+    plu_index = None
+    plu_code = ''
+    plu_event = None
+    plu_timeout = 1.2
+    usage = {}
+    favorites_size = 8
+    catalog_runner = None
+    catalog_seq = 0
+    catalog_fetching = False
+    catalog_loading = False
+    event_stream = None
+    event_revision = None
+    search_runner = None
+    search_event = None
+    search_seq = 0
+    search_debounce = 0.15
+    search_started = 0
 
     def build(self):
         self.theme_cls.primary_palette = 'Blue'
@@ -208,49 +439,218 @@ class ScaleApp(MDApp):
             if not os.path.exists(self.image_cache_dir):
                 os.makedirs(self.image_cache_dir)
         except Exception as e:
-            log_msg(f'FS Error: {e}', 'ERROR')
-        global KV_BUILDER
+            log_msg('FS Error: %s', e, level='ERROR')
+        self.telemetry = Telemetry()
+        self.http = HttpClient(workers=4, timeout=2, dispatch=run_on_ui)
+        self.endpoints = EndpointManager()
+        self.discovery = ServerDiscovery(log=log_msg)
+        self.api = ApiClient(self.http, self.endpoints, self.server_port, timeout=2, telemetry=self.telemetry)
+        # Monitor callbacks can fire on HTTP worker or event-stream threads;
+        # on_connectivity_change touches Kivy properties, so it runs on the UI.
+        self.monitor = ConnectivityMonitor(self.api, schedule=lambda delay, fn: Clock.schedule_once(fn, delay), on_change=lambda online: run_on_ui(partial(self.on_connectivity_change, online)))
+        self.api.on_reachable = self.monitor.note_success
+        self.api.on_unreachable = self.monitor.note_failure
+        self.print_outbox = PrintOutbox(os.path.join(self.data_dir, 'print_outbox.db'), self.api, schedule=lambda delay, fn: Clock.schedule_once(fn, delay), on_change=lambda n: setattr(self, 'pending_prints', n), on_dead=self.on_print_rejected, on_progress=self.on_print_progress, on_printed=self.on_labels_printed)
+        self.pending_prints = self.print_outbox.pending_count()
+        self.journal = SalesJournal(os.path.join(self.data_dir, 'sales_journal.db'), log=log_msg)
+        self.journal_uploader = JournalUploader(self.journal, self.api, schedule=lambda delay, fn: Clock.schedule_once(fn, delay), is_idle=self.is_idle, device_id=get_device_id_s())
+        threading.Thread(target=self.journal.prune, name='journal-prune', daemon=True).start()
+        self.image_cache = DiskImageCache(self.image_cache_dir)
+        self.image_loader = ImageLoader(self.image_cache, self.image_url_for, fetch=self.http.fetch, thumb_px=int(dp(70)), on_ready=self.on_image_ready)
+        self._ready_images = {}
+        self._waiting_rows = {}
+        self._ready_images_lock = threading.Lock()
+        self._apply_images_trigger = Clock.create_trigger(self.apply_ready_images)
+        mark_startup('services')
+        self.register_fonts()
+        self.shaper = get_shaper('display')
+        self.load_settings()
+        mark_startup('settings')
+        self.loaded_kv = set()
+        self.load_rules('login')
+        self.sm = MDScreenManager()
+        self.sm.add_widget(LoginScreen())
+        mark_startup('login_screen')
+        return self.sm
+
+    def register_fonts(self):
         font_path = 'font.ttf'
         if os.path.exists(font_path):
             try:
                 LabelBase.register(name='AppFont', fn_regular=font_path, fn_bold=font_path)
+                return
             except Exception as e:
-                log_msg(f'Error registering font: {e}', 'ERROR')
-                KV_BUILDER = KV_BUILDER.replace('font_name: "AppFont"', '')
+                log_msg('Error registering font: %s', e, level='ERROR')
         else:
-            log_msg('font.ttf not found. Using system defaults.', 'WARNING')
-            KV_BUILDER = KV_BUILDER.replace('font_name: "AppFont"', '')
-        try:
-            self.reshaper = arabic_reshaper.ArabicReshaper(configuration={'delete_harakat': True, 'support_ligatures': True})
-        except:
-            pass
-        self.load_settings()
-        Builder.load_string(KV_BUILDER)
-        self.sm = MDScreenManager()
-        self.sm.add_widget(LoginScreen())
-        self.sm.add_widget(MainScaleScreen())
-        return self.sm
+            log_msg('font.ttf not found. Using system defaults.', level='WARNING')
+        LabelBase.register(name='AppFont', fn_regular='data/fonts/Roboto-Regular.ttf', fn_bold='data/fonts/Roboto-Bold.ttf')
+
+    def load_rules(self, name):
+        # Kivy has no on-disk cache of compiled rules, so the next best thing
+        # is parsing each part once, and only when its screen is needed.
+        if name in self.loaded_kv:
+            return
+        Builder.load_string({'login': KV_LOGIN, 'main': KV_MAIN}[name], filename=f'<{name}.kv>')
+        self.loaded_kv.add(name)
+
+    def scale_screen(self):
+        if not self.sm.has_screen('scale'):
+            t0 = time.perf_counter()
+            self.load_rules('main')
+            self.sm.add_widget(MainScaleScreen())
+            self.apply_row_style()
+            log_msg('Main screen built in %.0f ms', (time.perf_counter() - t0) * 1000)
+        return self.sm.get_screen('scale')
+
+    def report_startup(self, *args):
+        mark_startup('first_frame')
+        total = sum(ms for _, ms in startup_phases)
+        log_msg('Startup: %s (total %.0fms)', ', '.join(f'{phase} {ms:.0f}ms' for phase, ms in startup_phases), total)
 
     def load_settings(self):
         try:
             self.store = JsonStore(os.path.join(self.data_dir, 'scale_settings.json'))
             self.license_store = JsonStore(os.path.join(self.data_dir, 'scale_license.json'))
-            self.cache_store = JsonStore(os.path.join(self.data_dir, 'products_cache.json'))
+            self.catalog_store = CatalogStore(os.path.join(self.data_dir, 'catalog.db'))
+            if self.catalog_store.import_legacy_json(os.path.join(self.data_dir, 'products_cache.json')):
+                log_msg('Migrated products_cache.json to catalog.db')
+            self.catalog_sync = CatalogSync(self.catalog_store.get_meta('etag', ''), self.catalog_store.get_meta('revision'))
+            self.usage = self.catalog_store.load_usage()
             if self.store.exists('config'):
                 config = self.store.get('config')
                 self.wifi_ip = config.get('wifi_ip', self.wifi_ip)
                 self.ethernet_ip = config.get('eth_ip', self.ethernet_ip)
                 self.sticker_size = config.get('sticker_size', self.sticker_size)
-            self.available_ips = []
-            if self.wifi_ip and self.is_valid_ip(self.wifi_ip):
-                self.available_ips.append(self.wifi_ip)
-            if self.ethernet_ip and self.is_valid_ip(self.ethernet_ip):
-                self.available_ips.append(self.ethernet_ip)
-            if not self.available_ips:
-                self.available_ips = ['192.168.1.100']
+                self.direct_print = config.get('direct_print', self.direct_print)
+                self.printer_ip = config.get('printer_ip', self.printer_ip)
+                self.printer_port = config.get('printer_port', self.printer_port)
+                self.printer_language = config.get('printer_language', self.printer_language)
+                self.telemetry_enabled = config.get('telemetry', self.telemetry_enabled)
+                self.scale_source = config.get('scale_source', self.scale_source)
+                self.auto_print = config.get('auto_print', self.auto_print)
+                self.fast_rows = config.get('fast_rows', self.fast_rows)
+            if self.store.exists('discovery'):
+                self.discovered = self.store.get('discovery').get('servers', [])
+            self.apply_endpoints()
+            self.apply_print_transport()
+            self.apply_telemetry()
+            self.apply_scale_input()
         except:
             pass
 
+    def apply_endpoints(self):
+        # Hand-typed addresses keep their priority; cached discoveries only
+        # follow them. Cached RTTs are not applied: a server that has since
+        # gone away would outrank the configured IPs and skip the first
+        # request race. Only a fresh probe ranks a discovered server.
+        ips = [ip for ip in (self.wifi_ip, self.ethernet_ip) if ip and self.is_valid_ip(ip)]
+        ips.extend(s['ip'] for s in self.discovered)
+        self.available_ips = list(dict.fromkeys(ips)) or ['192.168.1.100']
+        self.endpoints.set_ips(self.available_ips)
+
+    def discover_servers(self, *args):
+        if self.discovery_event:
+            self.discovery_event.cancel()
+            self.discovery_event = None
+        if self.discovery_running:
+            return
+        self.discovery_running = True
+        # Cached servers are probed by unicast in the same burst as the
+        # broadcast, for networks that drop broadcasts.
+        known = [s['ip'] for s in self.discovered] + self.available_ips
+        self.discovery.probe_async(known, lambda servers: Clock.schedule_once(lambda dt: self.on_servers_discovered(servers), 0))
+
+    def on_servers_discovered(self, servers):
+        self.discovery_running = False
+        port = int(self.server_port)
+        for s in servers:
+            if s['port'] != port:
+                log_msg('Discovery: %s serves on port %s, expected %s', s['ip'], s['port'], port, level='WARNING')
+        servers = [s for s in servers if s['port'] == port]
+        if servers:
+            now = int(time.time())
+            merged = {s['ip']: dict(s, seen=now) for s in servers}
+            for s in self.discovered:
+                merged.setdefault(s['ip'], s)
+            self.discovered = sorted(merged.values(), key=lambda s: (-s.get('seen', 0), s['rtt_ms']))[:self.discovery_keep]
+            self.store.put('discovery', servers=self.discovered)
+            self.apply_endpoints()
+            for s in servers:
+                self.endpoints.note_rtt(s['ip'], s['rtt_ms'] / 1000)
+            log_msg('Discovered servers: %s', ', '.join(f"{s['ip']} ({s['rtt_ms']}ms)" for s in servers))
+            if not self.is_connected and not self.monitor.paused:
+                self.monitor.start()
+        if self.is_connected:
+            self.discovery_retry = 5
+        else:
+            # Keep looking while offline, backing off so an unplugged scale
+            # does not broadcast every few seconds all day.
+            self.discovery_event = Clock.schedule_once(self.discover_servers, self.discovery_retry)
+            self.discovery_retry = min(self.discovery_retry * 2, self.discovery_retry_max)
+
+    def apply_print_transport(self):
+        if self.direct_print and self.printer_ip and self.is_valid_ip(self.printer_ip):
+            renderer = LabelRenderer(self.printer_language, font_path='font.ttf' if os.path.exists('font.ttf') else None, shaper=self.shaper)
+            self.print_outbox.direct = DirectPrinter(RawPrinter(self.printer_ip, self.printer_port), renderer, dispatch=run_on_ui)
+            log_msg('Direct printing to %s:%s (%s)', self.printer_ip, self.printer_port, self.printer_language)
+        else:
+            self.print_outbox.direct = None
+
+    def apply_scale_input(self):
+        self.stop_scale_input()
+        try:
+            source = open_source(self.scale_source)
+        except ValueError as e:
+            log_msg('%s', e, level='WARNING')
+            source = None
+        if source is None:
+            return
+        log_msg('Live weight from %s', source)
+        self.weight_trigger = StableTrigger()
+        self.weight_stream = WeightStream(source, stability=StabilityFilter(), on_status=lambda ok, err: log_msg('Scale %s disconnected: %s', source, err, level='WARNING') if err else log_msg('Scale %s connected', source)).start()
+        self.weight_event = Clock.schedule_interval(self.poll_weight, 1 / self.weight_poll_rate)
+        self.live_weight = True
+
+    def stop_scale_input(self):
+        if self.weight_event:
+            self.weight_event.cancel()
+            self.weight_event = None
+        if self.weight_stream:
+            self.weight_stream.stop()
+            self.weight_stream = None
+        self.live_weight = False
+        self.weight_stable = False
+
+    def poll_weight(self, dt):
+        seq, grams, stable = self.weight_stream.latest()
+        if seq == self.weight_seq:
+            return
+        self.weight_seq = seq
+        self.weight_stable = stable
+        if not self.selected_product or not self.sm.has_screen('scale'):
+            return
+        self.scale_screen().ids.txt_weight.text = str(grams) if grams and grams > 0 else ''
+        self.calculate_total()
+        if self.weight_trigger.update(grams or 0, stable) and self.auto_print:
+            self.send_print_command()
+
+    def apply_row_style(self):
+        if self.sm.has_screen('scale'):
+            self.sm.get_screen('scale').ids.rv.viewclass = 'FastProductItem' if self.fast_rows else 'ProductItem'
+
+    def apply_telemetry(self):
+        self.telemetry.enabled = self.telemetry_enabled
+        if self.frame_event:
+            self.frame_event.cancel()
+            self.frame_event = None
+        self.telemetry.stop_dumps()
+        if self.telemetry_enabled:
+            self.frame_event = Clock.schedule_interval(self.on_frame, 0)
+            self.telemetry.start_dumps(lambda delay, fn: Clock.schedule_once(fn, delay), os.path.join(self.data_dir, 'telemetry.json'))
+
+    def on_frame(self, dt):
+        self.telemetry.record('frame', dt * 1000)
+
     def is_valid_ip(self, ip):
         try:
             socket.inet_aton(ip)
@@ -259,6 +659,7 @@ class ScaleApp(MDApp):
             return False
 
     def on_start(self):
+        Clock.schedule_once(self.report_startup, 0)
         if platform == 'android':
             from android.permissions import request_permissions, Permission
             request_permissions([Permission.INTERNET, Permission.WRITE_EXTERNAL_STORAGE, Permission.READ_EXTERNAL_STORAGE])
@@ -270,14 +671,16 @@ class ScaleApp(MDApp):
                 try:
                     PythonActivity = autoclass('org.kivy.android.PythonActivity')
                     PythonActivity.mActivity.getWindow().addFlags(128)
-                    log_msg('Screen Keep On Set Successfully', 'INFO')
+                    log_msg('Screen Keep On Set Successfully')
                 except Exception as e:
-                    log_msg(f'Screen Keep On Error: {e}', 'ERROR')
+                    log_msg('Screen Keep On Error: %s', e, level='ERROR')
             set_keep_screen_on()
         Window.bind(on_keyboard=self.on_keyboard_handler)
+        Window.bind(on_touch_down=self.note_activity)
         if not self.check_license():
             Clock.schedule_once(lambda dt: self.show_activation_dialog(), 0.5)
             return
+        self.discover_servers()
         self.start_heartbeat()
         if self.sm.has_screen('login'):
             login_screen = self.sm.get_screen('login')
@@ -290,10 +693,23 @@ class ScaleApp(MDApp):
                 if user:
                     Clock.schedule_once(lambda dt: self.do_login(user, pwd), 1)
 
+    def on_stop(self):
+        self.stop_scale_input()
+        self.stop_events()
+        if self.journal_uploader:
+            self.journal_uploader.stop()
+        if self.print_outbox:
+            self.print_outbox.close()
+        if self.journal:
+            self.journal.close()
+        if self.http:
+            self.http.close()
+        logger.close()
+
     def on_keyboard_handler(self, window, key, *args):
         if key == 27:
             if self.sm.current == 'scale':
-                screen = self.root.get_screen('scale')        
+                screen = self.scale_screen()
                 if self.selected_product:
                     self.selected_product = None
                     screen.ids.bottom_nav.switch_tab('screen_products')
@@ -306,16 +722,38 @@ class ScaleApp(MDApp):
         return False
 
     def start_heartbeat(self):
-        if not self.heartbeat_event:
-            self.heartbeat_event = Clock.schedule_interval(self.check_connection_status, 5)
+        if self.monitor.paused:
+            self.monitor.start()
 
-    def check_connection_status(self, dt):
-        if not self.available_ips:
-            self.is_connected = False
-            return
-        ip = self.available_ips[self.current_ip_index]
-        url = f'http://{ip}:{self.server_port}/api/products'
-        UrlRequest(url, method='HEAD', on_success=lambda r, res: setattr(self, 'is_connected', True), on_failure=lambda r, e: setattr(self, 'is_connected', False), on_error=lambda r, e: setattr(self, 'is_connected', False), timeout=1.5)
+    def on_connectivity_change(self, online):
+        self.is_connected = online
+        if online and self.print_outbox:
+            self.print_outbox.flush()
+        if online:
+            self.discovery_retry = 5
+            if self.discovery_event:
+                self.discovery_event.cancel()
+                self.discovery_event = None
+        else:
+            self.discover_servers()
+
+    def on_pause(self):
+        if self.monitor:
+            self.monitor.pause()
+        self.stop_scale_input()
+        self.stop_events()
+        if self.journal_uploader:
+            self.journal_uploader.stop()
+        return True
+
+    def on_resume(self):
+        if self.monitor and self.check_license():
+            self.monitor.resume()
+            self.discover_servers()
+        self.apply_scale_input()
+        if self.root.current == 'scale':
+            self.start_events()
+            self.journal_uploader.start()
 
     def check_license(self):
         if not self.license_store.exists('license'):
@@ -329,6 +767,11 @@ class ScaleApp(MDApp):
         return stored_key == expected
 
     def show_activation_dialog(self):
+        from kivy.core.clipboard import Clipboard
+        from kivymd.uix.button import MDIconButton, MDRaisedButton
+        from kivymd.uix.card import MDCard
+        from kivymd.uix.dialog import MDDialog
+        from kivymd.uix.label import MDIcon, MDLabel
         dev_id = get_device_id_s()
         content = MDBoxLayout(orientation='vertical', spacing='12dp', size_hint_y=None, adaptive_height=True, padding=['20dp', '20dp', '20dp', '10dp'])
         content.add_widget(MDIcon(icon='shield-lock', halign='center', font_size='64sp', theme_text_color='Custom', text_color=self.theme_cls.primary_color, pos_hint={'center_x': 0.5}))
@@ -366,51 +809,25 @@ class ScaleApp(MDApp):
             self.show_alert('Erreur', 'Clé invalide !')
 
     def fix_text(self, text):
-        if not text or not isinstance(text, str):
-            return str(text) if text is not None else ''
-        if any(('\u0600' <= c <= 'ۿ' for c in text)):
-            try:
-                reshaped_text = self.reshaper.reshape(text)
-                return get_display(reshaped_text)
-            except Exception:
-                return text
-        return text
+        return self.shaper.shape(text)
 
     def get_active_url(self, endpoint):
-        if not self.available_ips:
+        ip = self.endpoints.best()
+        if not ip:
             return None
-        ip = self.available_ips[self.current_ip_index]
         return f'http://{ip}:{self.server_port}{endpoint}'
 
-    def switch_ip_and_retry(self, endpoint, method, body, headers, success_callback, failure_callback, original_req=None):
-        self.current_ip_index += 1
-        if self.current_ip_index >= len(self.available_ips):
-            self.current_ip_index = 0
-            self.is_connected = False
-            if failure_callback:
-                failure_callback(original_req, 'Connexion perdue')
-            return
-        new_ip = self.available_ips[self.current_ip_index]
-        url = f'http://{new_ip}:{self.server_port}{endpoint}'
-        UrlRequest(url, req_body=body, req_headers=headers, method=method, on_success=lambda r, res: self._wrap_success(r, res, success_callback), on_error=lambda r, err: self.switch_ip_and_retry(endpoint, method, body, headers, success_callback, failure_callback, r), on_failure=lambda r, err: self.switch_ip_and_retry(endpoint, method, body, headers, success_callback, failure_callback, r), timeout=2)
-
-    def send_request(self, endpoint, method='GET', body=None, headers=None, on_success=None, on_failure=None):
+    def send_request(self, endpoint, method='GET', body=None, headers=None, on_success=None, on_failure=None, idempotent=None, decode=True):
         if headers is None:
             headers = {'Content-type': 'application/json'}
-        url = self.get_active_url(endpoint)
-        if not url:
-            if on_failure:
-                on_failure(None, 'Aucune IP configurée')
-            return
-        UrlRequest(url, req_body=body, req_headers=headers, method=method, on_success=lambda r, res: self._wrap_success(r, res, on_success), on_error=lambda r, err: self.switch_ip_and_retry(endpoint, method, body, headers, on_success, on_failure, r), on_failure=lambda r, err: self.switch_ip_and_retry(endpoint, method, body, headers, on_success, on_failure, r), timeout=2)
-
-    def _wrap_success(self, req, res, original_callback):
-        self.is_connected = True
-        if original_callback:
-            original_callback(req, res)
+        self.api.request(endpoint, method, body, headers, on_success=on_success, on_failure=on_failure, idempotent=idempotent, decode=decode)
 
     def open_settings_dialog(self):
-        content_box = MDBoxLayout(orientation='vertical', size_hint_y=None, height=dp(400))
+        from kivymd.uix.button import MDFlatButton, MDRaisedButton
+        from kivymd.uix.dialog import MDDialog
+        from kivymd.uix.list import IconLeftWidget, MDList, OneLineIconListItem
+        from kivymd.uix.scrollview import MDScrollView
+        content_box = MDBoxLayout(orientation='vertical', size_hint_y=None, height=dp(520))
         scroll = MDScrollView()
         list_layout = MDList()
         header_net = OneLineIconListItem(text='Configuration Réseau', bg_color=(0.95, 0.95, 0.95, 1))
@@ -443,41 +860,177 @@ class ScaleApp(MDApp):
             btn.bind(on_release=set_size)
             size_box.add_widget(btn)
         list_layout.add_widget(size_box)
+        mode_box = MDBoxLayout(orientation='horizontal', spacing=dp(10), padding=dp(20), size_hint_y=None, height=dp(60), pos_hint={'center_x': 0.5})
+
+        def set_mode(inst):
+            self.direct_print = inst.text != 'SERVEUR'
+            if self.direct_print:
+                self.printer_language = inst.text.lower()
+            self.printer_ip = self.tf_printer.text.strip()
+            self.scale_source = self.tf_scale.text.strip()
+            self.dialog.dismiss()
+            self.open_settings_dialog()
+        current_mode = self.printer_language.upper() if self.direct_print else 'SERVEUR'
+        for m in ['SERVEUR', 'TSPL', 'ZPL']:
+            if m == current_mode:
+                btn = MDRaisedButton(text=m, md_bg_color=(0, 0.7, 0, 1), elevation=2)
+            else:
+                btn = MDRaisedButton(text=m, md_bg_color=(0.8, 0.8, 0.8, 1), text_color=(0, 0, 0, 1), elevation=0)
+            btn.bind(on_release=set_mode)
+            mode_box.add_widget(btn)
+        list_layout.add_widget(mode_box)
+        self.tf_printer = MDTextField(text=self.printer_ip, hint_text='IP IMPRIMANTE (port 9100)', mode='rectangle')
+        item_printer = MDBoxLayout(padding=dp(20), size_hint_y=None, height=dp(80))
+        item_printer.add_widget(self.tf_printer)
+        list_layout.add_widget(item_printer)
+        header_scale = OneLineIconListItem(text='Balance connectée', bg_color=(0.95, 0.95, 0.95, 1))
+        header_scale.add_widget(IconLeftWidget(icon='scale'))
+        list_layout.add_widget(header_scale)
+        self.tf_scale = MDTextField(text=self.scale_source, hint_text='BALANCE (ip:port ou /dev/ttyUSB0@9600)', mode='rectangle')
+        item_scale = MDBoxLayout(padding=dp(20), size_hint_y=None, height=dp(80))
+        item_scale.add_widget(self.tf_scale)
+        list_layout.add_widget(item_scale)
+        auto_box = MDBoxLayout(orientation='horizontal', spacing=dp(10), padding=dp(20), size_hint_y=None, height=dp(60), pos_hint={'center_x': 0.5})
+
+        def toggle_auto_print(inst):
+            self.auto_print = not self.auto_print
+            self.printer_ip = self.tf_printer.text.strip()
+            self.scale_source = self.tf_scale.text.strip()
+            self.dialog.dismiss()
+            self.open_settings_dialog()
+        if self.auto_print:
+            btn = MDRaisedButton(text='IMPRESSION AUTO: OUI', md_bg_color=(0, 0.7, 0, 1), elevation=2)
+        else:
+            btn = MDRaisedButton(text='IMPRESSION AUTO: NON', md_bg_color=(0.8, 0.8, 0.8, 1), text_color=(0, 0, 0, 1), elevation=0)
+        btn.bind(on_release=toggle_auto_print)
+        auto_box.add_widget(btn)
+        list_layout.add_widget(auto_box)
+        header_display = OneLineIconListItem(text='Affichage', bg_color=(0.95, 0.95, 0.95, 1))
+        header_display.add_widget(IconLeftWidget(icon='view-list'))
+        list_layout.add_widget(header_display)
+        display_box = MDBoxLayout(orientation='horizontal', spacing=dp(10), padding=dp(20), size_hint_y=None, height=dp(60), pos_hint={'center_x': 0.5})
+
+        def toggle_rows(inst):
+            self.fast_rows = not self.fast_rows
+            self.apply_row_style()
+            self.dialog.dismiss()
+            self.open_settings_dialog()
+        if self.fast_rows:
+            btn = MDRaisedButton(text='LISTE: RAPIDE', md_bg_color=(0, 0.7, 0, 1), elevation=2)
+        else:
+            btn = MDRaisedButton(text='LISTE: ILLUSTRÉE', md_bg_color=(0.8, 0.8, 0.8, 1), text_color=(0, 0, 0, 1), elevation=0)
+        btn.bind(on_release=toggle_rows)
+        display_box.add_widget(btn)
+        list_layout.add_widget(display_box)
+        header_diag = OneLineIconListItem(text='Diagnostics', bg_color=(0.95, 0.95, 0.95, 1))
+        header_diag.add_widget(IconLeftWidget(icon='chart-line'))
+        list_layout.add_widget(header_diag)
+        diag_box = MDBoxLayout(orientation='horizontal', spacing=dp(10), padding=dp(20), size_hint_y=None, height=dp(60), pos_hint={'center_x': 0.5})
+
+        def toggle_telemetry(inst):
+            self.telemetry_enabled = not self.telemetry_enabled
+            self.apply_telemetry()
+            self.dialog.dismiss()
+            self.open_settings_dialog()
+        if self.telemetry_enabled:
+            btn = MDRaisedButton(text='MESURES: OUI', md_bg_color=(0, 0.7, 0, 1), elevation=2)
+        else:
+            btn = MDRaisedButton(text='MESURES: NON', md_bg_color=(0.8, 0.8, 0.8, 1), text_color=(0, 0, 0, 1), elevation=0)
+        btn.bind(on_release=toggle_telemetry)
+        diag_box.add_widget(btn)
+        diag_box.add_widget(MDRaisedButton(text='VOIR', md_bg_color=(0.2, 0.4, 0.8, 1), on_release=lambda x: self.show_diagnostics()))
+        diag_box.add_widget(MDRaisedButton(text='VENTES DU JOUR', md_bg_color=(0.2, 0.4, 0.8, 1), on_release=lambda x: self.show_daily_totals()))
+        list_layout.add_widget(diag_box)
         scroll.add_widget(list_layout)
         content_box.add_widget(scroll)
 
         def save(x):
             self.wifi_ip = self.tf_wifi.text.strip()
             self.ethernet_ip = self.tf_eth.text.strip()
-            self.available_ips = []
-            if self.wifi_ip and self.is_valid_ip(self.wifi_ip):
-                self.available_ips.append(self.wifi_ip)
-            if self.ethernet_ip and self.is_valid_ip(self.ethernet_ip):
-                self.available_ips.append(self.ethernet_ip)
-            self.current_ip_index = 0
-            self.store.put('config', wifi_ip=self.wifi_ip, eth_ip=self.ethernet_ip, sticker_size=self.sticker_size)
+            self.apply_endpoints()
+            self.printer_ip = self.tf_printer.text.strip()
+            self.apply_print_transport()
+            self.scale_source = self.tf_scale.text.strip()
+            self.apply_scale_input()
+            self.store.put('config', wifi_ip=self.wifi_ip, eth_ip=self.ethernet_ip, sticker_size=self.sticker_size, direct_print=self.direct_print, printer_ip=self.printer_ip, printer_port=self.printer_port, printer_language=self.printer_language, telemetry=self.telemetry_enabled, scale_source=self.scale_source, auto_print=self.auto_print, fast_rows=self.fast_rows)
             if self.dialog:
                 self.dialog.dismiss()
             self.show_alert('Succès', 'Paramètres enregistrés')
         self.dialog = MDDialog(title='Paramètres', type='custom', content_cls=content_box, buttons=[MDFlatButton(text='ANNULER', on_release=lambda x: self.dialog.dismiss()), MDRaisedButton(text='SAUVEGARDER', md_bg_color=(0, 0.7, 0, 1), on_release=save)], size_hint=(0.9, 0.8))
         self.dialog.open()
 
+    def show_diagnostics(self):
+        from kivymd.uix.button import MDFlatButton
+        from kivymd.uix.dialog import MDDialog
+        from kivymd.uix.label import MDLabel
+        from kivymd.uix.scrollview import MDScrollView
+        if self.dialog:
+            self.dialog.dismiss()
+        if not self.telemetry_enabled:
+            text = 'Mesures désactivées.'
+        else:
+            text = self.telemetry.report() or 'Aucune mesure pour le moment.'
+        endpoints = '\n'.join(f"{e['ip']}: rtt={e['rtt_ms']}ms fails={e['failures']}" for e in self.endpoints.snapshot()) if self.endpoints else ''
+        label = MDLabel(text=f'{text}\n\n{endpoints}'.strip(), font_style='Caption', size_hint_y=None)
+        label.bind(texture_size=lambda inst, size: setattr(inst, 'height', size[1]))
+        scroll = MDScrollView(size_hint_y=None, height=dp(360))
+        scroll.add_widget(label)
+
+        def reset(x):
+            self.telemetry.reset()
+            self.dialog.dismiss()
+        self.dialog = MDDialog(title='Diagnostics', type='custom', content_cls=scroll, buttons=[MDFlatButton(text='RÉINITIALISER', on_release=reset), MDFlatButton(text='FERMER', on_release=lambda x: self.dialog.dismiss())], size_hint=(0.95, None))
+        self.dialog.open()
+
+    def show_daily_totals(self):
+        from kivymd.uix.button import MDFlatButton
+        from kivymd.uix.dialog import MDDialog
+        from kivymd.uix.label import MDLabel
+        from kivymd.uix.scrollview import MDScrollView
+        if self.dialog:
+            self.dialog.dismiss()
+        # Straight off the local journal: works offline and costs one
+        # indexed GROUP BY on today's rows.
+        self.journal.flush()
+        lines = []
+        grand = 0
+        for pid, ref, count, copies, grams, cents in self.journal.daily_totals():
+            product = self.plu_index.get(pid) if self.plu_index else None
+            name = product['name'] if product else (ref or str(pid))
+            grand += cents or 0
+            lines.append(f'{name}: {count} pesées, {copies} étiq., {grams / 1000:.3f} kg, {format_cents(cents or 0)} DA')
+        lines.append(f'\nTOTAL: {format_cents(grand)} DA' if lines else 'Aucune vente aujourd\'hui.')
+        pending = self.journal.pending_count()
+        if pending:
+            lines.append(f'{pending} ligne(s) en attente d\'envoi')
+        label = MDLabel(text='\n'.join(lines), font_style='Caption', size_hint_y=None)
+        label.bind(texture_size=lambda inst, size: setattr(inst, 'height', size[1]))
+        scroll = MDScrollView(size_hint_y=None, height=dp(360))
+        scroll.add_widget(label)
+        self.dialog = MDDialog(title='Ventes du jour', type='custom', content_cls=scroll, buttons=[MDFlatButton(text='FERMER', on_release=lambda x: self.dialog.dismiss())], size_hint=(0.95, None))
+        self.dialog.open()
+
     def do_login(self, username, password):
         if not username:
             self.show_alert('Erreur', 'Nom utilisateur requis')
             return
+        from kivymd.uix.dialog import MDDialog
         body = json.dumps({'username': username, 'password': password})
         self.dialog_loading = MDDialog(text='Connexion en cours...', auto_dismiss=False)
         self.dialog_loading.open()
-        self.send_request('/api/login', 'POST', body, on_success=self.on_login_success, on_failure=self.on_login_fail)
+        self.send_request('/api/login', 'POST', body, on_success=self.on_login_success, on_failure=self.on_login_fail, idempotent=True)
+        Clock.schedule_once(lambda dt: self.scale_screen(), 0)
 
     def on_login_success(self, req, res):
         if self.dialog_loading:
             self.dialog_loading.dismiss()
         if res.get('status') == 'success':
             self.store.put('credentials', username=self.root.get_screen('login').ids.user_field.get_value(), password=self.root.get_screen('login').ids.pass_field.get_value())
+            self.scale_screen()
             self.root.current = 'scale'
             self.fetch_products()
+            self.start_events()
+            self.journal_uploader.start()
         else:
             self.show_alert('Échec', 'Identifiants incorrects')
 
@@ -487,104 +1040,456 @@ class ScaleApp(MDApp):
         self.show_alert('Erreur', 'Serveur inaccessible')
 
     def logout(self):
+        self.stop_events()
+        self.journal_uploader.stop()
         self.root.current = 'login'
         self.selected_product = None
 
-    def fetch_products(self):
-        self.send_request('/api/products', 'GET', on_success=self.on_products_loaded, on_failure=self.on_products_fail)
+    def has_cached_catalog(self):
+        return bool(self.catalog_store and self.catalog_store.has_items())
 
-    def on_products_fail(self, req, err):
-        log_msg(f'Products Fail: {err}', 'ERROR')
-        if self.cache_store.exists('products_data'):
-            cached = self.cache_store.get('products_data').get('items', [])
-            if cached:
-                self.show_alert('Mode Hors Ligne', 'Chargement depuis le cache local.')
-                self.on_products_loaded(None, cached)
+    def fetch_products(self, force_full=False):
+        if not self.catalog_sync:
+            self.catalog_sync = CatalogSync()
+        endpoint, headers = self.catalog_sync.request_args(self.has_cached_catalog(), force_full)
+        self.catalog_fetching = True
+        self.send_request(endpoint, 'GET', headers=headers, on_success=partial(self.on_catalog_response, force_full), on_failure=self.on_products_fail, decode=False)
+
+    def on_catalog_response(self, force_full, req, res):
+        # Array bodies are decoded lazily by the catalog worker, but a dict
+        # body (delta or {"items": [...]}) is a single json.loads; parse on
+        # a thread so neither form is decoded on the UI thread.
+        status, headers = getattr(req, 'resp_status', None), getattr(req, 'resp_headers', None)
+        has_local = self.has_cached_catalog()
+
+        def parse():
+            update = self.catalog_sync.parse(status, headers, res, has_local)
+            Clock.schedule_once(lambda dt: self.on_catalog_update(force_full, req, update), 0)
+        threading.Thread(target=parse, name='catalog-parse', daemon=True).start()
+
+    def on_catalog_update(self, force_full, req, update):
+        self.catalog_fetching = False
+        kind = update['kind']
+        if kind == 'resync':
+            if force_full:
+                self.on_products_fail(req, 'Réponse catalogue invalide')
                 return
+            log_msg('Catalog revision chain broken, reloading full catalog', level='WARNING')
+            self.catalog_sync.reset()
+            self.fetch_products(force_full=True)
+            return
+        if kind == 'unchanged':
+            log_msg('Catalog not modified')
+            if not self.all_products:
+                self.load_catalog(self.catalog_store.iter_items())
+            return
+        etag, revision = update['etag'], update['revision']
+        if kind == 'delta':
+            log_msg('Catalog delta: %d upserts, %d deletes', len(update['upserts']), len(update['deleted']))
+            self.catalog_sync.commit(etag, revision)
+            meta = {'etag': etag, 'revision': revision}
+            self.catalog_store.run_async(self.catalog_store.apply_delta, update['upserts'], update['deleted'], meta, on_done=self._on_catalog_merged)
+            return
+        self.load_catalog(update['items'], on_loaded=partial(self._on_catalog_streamed, etag, revision))
+
+    def _on_catalog_streamed(self, etag, revision, raws):
+        # The body is only fully decoded once the stream has been consumed,
+        # so the revision is committed and the cache rewritten from here.
+        self.catalog_sync.commit(etag, revision)
+        meta = {'etag': etag, 'revision': revision}
+        self.catalog_store.run_async(self.catalog_store.replace_all, raws, meta, on_done=self._on_catalog_saved)
+
+    def _on_catalog_merged(self, result, error):
+        if error:
+            log_msg('Catalog merge error: %s', error, level='ERROR')
+            self.catalog_sync.reset()
+            Clock.schedule_once(lambda dt: self.fetch_products(force_full=True), 0)
+            return
+        Clock.schedule_once(lambda dt: self.load_catalog(self.catalog_store.iter_items()), 0)
+
+    def _on_catalog_saved(self, result, error):
+        if error:
+            log_msg('Catalog cache write error: %s', error, level='ERROR')
+            self.catalog_sync.reset()
+
+    def on_products_fail(self, req, err):
+        self.catalog_fetching = False
+        log_msg('Products Fail: %s', err, level='ERROR')
+        if self.has_cached_catalog():
+            self.show_alert('Mode Hors Ligne', 'Chargement depuis le cache local.')
+            self.load_catalog(self.catalog_store.iter_items())
+            return
         self.show_alert('Erreur', f'Échec du chargement:\n{err}')
 
     def get_cached_image_url(self, image_path_from_server):
-        if not image_path_from_server:
-            return ''
-        try:
-            filename = os.path.basename(image_path_from_server.replace('\\', '/'))
-            local_path = os.path.join(self.image_cache_dir, filename)
-            if os.path.exists(local_path):
-                return local_path
-            if not self.available_ips:
-                return ''
-            ip = self.available_ips[self.current_ip_index]
-            img_url = f'http://{ip}:{self.server_port}/api/images/{filename}'
-            UrlRequest(img_url, on_success=lambda r, res: open(local_path, 'wb').write(res))
-            return img_url
-        except:
-            return ''
-
-    def on_products_loaded(self, req, res):
-        if res and isinstance(res, list):
-            self.cache_store.put('products_data', items=res)
-        self.all_products = []
-        valid_units = ['kg', 'g', 'gramme', 'kilogramme', 'كغ', 'غرام', 'kilo', 'لتر', 'l', 'litre']
-        server_image_filenames = set()
-        for p in res:
-            try:
-                price = float(str(p.get('price', 0)).replace(',', '.'))
-            except:
-                price = 0.0
-            if price <= 0:
-                continue
-            unit = str(p.get('unit', '')).lower().strip()
-            if not any((u in unit for u in valid_units)):
-                continue
-            img_path = p.get('image', '')
-            if img_path:
-                filename = os.path.basename(img_path.replace('\\', '/'))
-                server_image_filenames.add(filename)
-            self.all_products.append({'id': p['id'], 'name': p['name'], 'price': price, 'image': img_path, 'ref': str(p.get('ref', ''))})
-        if os.path.exists(self.image_cache_dir):
+        return self.image_cache.get(image_filename(image_path_from_server)) or ''
+
+    def image_url_for(self, filename):
+        return self.get_active_url(f'/api/images/{filename}')
+
+    def request_row_images(self, rv, index):
+        data = rv.data
+        for row in data[index:index + self.image_prefetch + 1]:
+            if not row.get('image_url'):
+                p = row.get('product_data') or {}
+                filename = image_filename(p.get('image'))
+                path = self.image_loader.request(filename)
+                if path:
+                    self.on_image_ready(filename, path)
+
+    def on_image_ready(self, filename, path):
+        with self._ready_images_lock:
+            self._ready_images[filename] = path
+        self._apply_images_trigger()
+
+    def apply_ready_images(self, *args):
+        with self._ready_images_lock:
+            ready, self._ready_images = self._ready_images, {}
+        if not ready or not self.sm.has_screen('scale'):
+            return
+        rv = self.scale_screen().ids.rv
+        data = rv.data
+        waiting = self._waiting_rows
+        changed = False
+        for filename, path in ready.items():
+            for i in waiting.pop(filename, ()):
+                data[i]['image_url'] = path
+                changed = True
+        if changed:
+            rv.refresh_from_data()
+
+    def index_waiting_rows(self, rows, start=0):
+        # Positions in rv.data of the rows still showing a placeholder, by
+        # image filename, so a finished image batch only touches its rows.
+        # Rebuilt whenever rv.data is replaced, extended when it grows.
+        if start == 0:
+            self._waiting_rows = {}
+        waiting = self._waiting_rows
+        for i, row in enumerate(rows, start):
+            if not row.get('image_url'):
+                filename = image_filename((row.get('product_data') or {}).get('image'))
+                if filename:
+                    waiting.setdefault(filename, []).append(i)
+
+    def load_catalog(self, source, on_loaded=None):
+        # Decoding, validation, unit filtering and name shaping all run on
+        # the catalog worker; rows reach the list in chunks so the first
+        # products show up while the rest of the catalog is still parsing.
+        self.catalog_seq += 1
+        seq = self.catalog_seq
+        self.search_index = None
+        self.catalog_loading = True
+        self.row_cache = RowCache(self.fix_text, self.get_cached_image_url)
+        if not self.catalog_runner:
+            self.catalog_runner = QueryRunner('catalog', log=log_msg)
+        started = time.perf_counter()
+        shaped = [0]
+
+        def on_chunk(chunk):
+            shaped[0] += len(chunk)
+            self.shaper.reserve(shaped[0])
+            for p in chunk:
+                self.shaper.shape(p['name'])
+            first = shaped[0] == len(chunk)
+            if first:
+                self.telemetry.record('catalog_first_rows', (time.perf_counter() - started) * 1000)
+            Clock.schedule_once(lambda dt: self.on_catalog_chunk(seq, chunk, first), 0)
+
+        def work(is_stale):
             try:
-                cached_files = os.listdir(self.image_cache_dir)
-                for f in cached_files:
-                    if f not in server_image_filenames:
-                        try:
-                            full_path = os.path.join(self.image_cache_dir, f)
-                            os.remove(full_path)
-                        except:
-                            pass
+                with self.telemetry.timer('catalog_load'):
+                    result = stream_catalog(source, on_chunk, is_stale)
+                    if result is None:
+                        return None
+                    raws, products = result
+                    index = SearchIndex(products)
+                    plu = PluIndex(products)
             except Exception as e:
-                pass
-        self.update_rv(self.all_products)
-        if not self.all_products:
+                error = e
+                Clock.schedule_once(lambda dt: self.on_catalog_error(seq, error), 0)
+                return None
+            return raws, products, index, plu
+        self.catalog_runner.submit(work, lambda result: Clock.schedule_once(lambda dt: self.on_catalog_loaded(seq, on_loaded, *result), 0))
+
+    def on_catalog_chunk(self, seq, chunk, first):
+        if seq != self.catalog_seq:
+            return
+        if first:
+            self.all_products = list(chunk)
+            self.update_rv(self.row_cache.rows(self.all_products))
+            return
+        self.all_products.extend(chunk)
+        if self.scale_screen().ids.search_box.get_value():
+            return
+        with self.telemetry.timer('update_rv'):
+            rv = self.scale_screen().ids.rv
+            rows = self.row_cache.rows(chunk)
+            self.index_waiting_rows(rows, len(rv.data))
+            rv.data.extend(rows)
+
+    def on_catalog_loaded(self, seq, on_loaded, raws, products, index, plu):
+        if seq != self.catalog_seq:
+            return
+        self.catalog_loading = False
+        log_msg('Catalog loaded: %d weighable of %d products', len(products), len(raws))
+        if not products:
+            self.update_rv([])
+        self.all_products = products
+        self.search_index = index
+        self.plu_index = plu
+        self.refresh_favorites()
+        if on_loaded:
+            on_loaded(raws)
+        if not products:
             self.show_alert('Info', 'Aucun produit pesable trouvé (kg, g...).')
+        query = self.scale_screen().ids.search_box.get_value()
+        if query:
+            self.run_search(query, self.search_seq)
+        self.catch_up_events()
+
+    def on_catalog_error(self, seq, error):
+        if seq != self.catalog_seq:
+            return
+        self.catalog_loading = False
+        log_msg('Catalog decode error: %s', error, level='ERROR')
+        self.catalog_sync.reset()
+        self.on_products_fail(None, error)
+
+    def start_events(self):
+        if self.event_stream:
+            return
+        self.event_stream = EventStream(lambda: self.get_active_url('/api/events'), on_event=lambda event: run_on_ui(partial(self.on_server_event, event)), on_status=self.on_events_status, on_traffic=(lambda: run_on_ui(self.monitor.note_success)) if self.monitor else None).start()
+
+    def stop_events(self):
+        if self.event_stream:
+            self.event_stream.stop()
+            self.event_stream = None
+
+    def on_events_status(self, connected, error):
+        if connected:
+            log_msg('Event stream connected')
+        else:
+            log_msg('Event stream lost: %s', error, level='WARNING')
+
+    def on_server_event(self, event):
+        data = event.get('data')
+        if not isinstance(data, dict):
+            return
+        self.event_revision = data.get('revision', self.event_revision)
+        if event.get('event') != 'catalog' or self.catalog_fetching or self.catalog_loading or self.plu_index is None:
+            self.catch_up_events()
+            return
+        update = self.catalog_sync.parse(200, None, data, self.has_cached_catalog())
+        if update['kind'] != 'delta':
+            self.catch_up_events()
+            return
+        # The stored ETag describes the last full body; drop it so the next
+        # fetch asks for changes since the pushed revision instead.
+        self.catalog_sync.commit('', update['revision'])
+        meta = {'etag': '', 'revision': update['revision']}
+        self.catalog_store.run_async(self.catalog_store.apply_delta, update['upserts'], update['deleted'], meta, on_done=self._on_catalog_saved)
+        with self.telemetry.timer('apply_catalog_event'):
+            self.apply_catalog_changes(update['upserts'], update['deleted'])
+
+    def catch_up_events(self):
+        if self.catalog_fetching or self.catalog_loading or not self.catalog_sync:
+            return
+        if self.catalog_sync.is_behind(self.event_revision):
+            log_msg('Catalog behind pushed revision %s, fetching changes', self.event_revision)
+            self.fetch_products()
+
+    def apply_catalog_changes(self, upserts, deleted):
+        plu = self.plu_index
+        gone = {str(i) for i in deleted or []}
+        added, changed, removed = [], [], []
+        renamed = False
+        for raw in upserts or []:
+            current = plu.get(raw.get('id'))
+            product = normalize_product(raw)
+            if current is None:
+                if product is not None:
+                    plu.add(product)
+                    added.append(product)
+            elif product is None:
+                gone.add(str(current['id']))
+            else:
+                if product['name'] != current['name'] or product['ref'] != current['ref']:
+                    renamed = True
+                plu.remove(current)
+                current.update(product)
+                plu.add(current)
+                changed.append(current)
+        for pid in gone:
+            current = plu.get(pid)
+            if current is not None:
+                plu.remove(current)
+                removed.append(current)
+        # Changed rows are patched in place in the shared cache, so whatever
+        # selection is on screen only needs a redraw, not a position lookup.
+        rv = self.scale_screen().ids.rv
+        cache = self.row_cache
+        for p in changed:
+            cache.update(p)
+        if removed:
+            dead = {id(p) for p in removed}
+            for p in removed:
+                cache.discard(p)
+            rv.data = [row for row in rv.data if id(row['product_data']) not in dead]
+        elif changed:
+            rv.refresh_from_data()
+        if added and not self.scale_screen().ids.search_box.get_value():
+            rv.data.extend(cache.rows(added))
+        if removed or changed or added:
+            # A changed product may point at another image; reindex once.
+            self.index_waiting_rows(rv.data)
+        selected = self.selected_product
+        if selected is not None and any(p is selected for p in changed):
+            screen = self.scale_screen()
+            screen.ids.lbl_name.text = self.fix_text(selected['name'])
+            screen.ids.lbl_price_unit.text = f"{selected['price']:.2f} DA"
+            self.price_cents = to_cents(selected['price'])
+            self.calculate_total()
+        if gone or added or renamed:
+            self.all_products = [p for p in self.all_products if str(p['id']) not in gone] + added
+            self.reindex_search(self.all_products)
+            self.refresh_favorites()
+        log_msg('Catalog event: %d changed, %d added, %d removed', len(changed), len(added), len(gone))
+
+    def reindex_search(self, products):
+        seq = self.catalog_seq
 
-    def update_rv(self, products):
-        data = []
-        for p in products:
-            img_src = self.get_cached_image_url(p['image'])
-            data.append({'text_name': self.fix_text(p['name']), 'text_price': f"{p['price']:.2f} DA", 'image_url': img_src, 'product_data': p})
-        self.root.get_screen('scale').ids.rv.data = data
-        self.root.get_screen('scale').ids.rv.refresh_from_data()
+        def build():
+            index = SearchIndex(products)
+            Clock.schedule_once(lambda dt: self.on_search_reindexed(seq, products, index), 0)
+        threading.Thread(target=build, name='search-index', daemon=True).start()
+
+    def on_search_reindexed(self, seq, products, index):
+        if seq != self.catalog_seq or products is not self.all_products:
+            return
+        self.search_index = index
+        query = self.scale_screen().ids.search_box.get_value()
+        if query:
+            self.run_search(query, self.search_seq)
+
+    def update_rv(self, rows):
+        # Assigning data already schedules a refresh of the view.
+        with self.telemetry.timer('update_rv'):
+            self.scale_screen().ids.rv.data = rows
+            self.index_waiting_rows(rows)
 
     def filter_products(self, text):
+        self.search_seq += 1
+        self.search_started = time.perf_counter()
+        if self.search_event:
+            self.search_event.cancel()
+            self.search_event = None
         if not text:
-            self.update_rv(self.all_products)
+            if self.search_runner:
+                self.search_runner.cancel()
+            self.update_rv(self.row_cache.rows(self.all_products) if self.row_cache else [])
+            return
+        seq = self.search_seq
+        self.search_event = Clock.schedule_once(lambda dt: self.run_search(text, seq), self.search_debounce)
+
+    def run_search(self, text, seq):
+        self.search_event = None
+        index = self.search_index
+        if index is None or seq != self.search_seq:
             return
-        q = text.lower()
-        filtered = [p for p in self.all_products if q in p['name'].lower()]
-        self.update_rv(filtered)
+        if not self.search_runner:
+            self.search_runner = QueryRunner('search', log=log_msg)
+        self.search_runner.submit(lambda is_stale: self._timed_search(index, text, is_stale), lambda hits: Clock.schedule_once(lambda dt: self.on_search_done(index, seq, hits), 0))
+
+    def _timed_search(self, index, text, is_stale):
+        with self.telemetry.timer('search'):
+            hits = index.search(text, is_stale)
+            if hits is None:
+                return None
+            return rank_by_usage(hits, index.products, self.usage)
+
+    def on_search_done(self, index, seq, hits):
+        if seq != self.search_seq or index is not self.search_index:
+            return
+        self.update_rv(self.row_cache.select(index.products, hits))
+        self.telemetry.record('filter_products', (time.perf_counter() - self.search_started) * 1000)
 
     def select_product(self, product):
+        if self.print_batch and (not self.selected_product or product['id'] != self.selected_product['id']):
+            from kivymd.toast import toast
+            toast('Lot annulé')
+            self.reset_batch()
         self.selected_product = product
-        screen = self.root.get_screen('scale')
+        screen = self.scale_screen()
         screen.ids.bottom_nav.switch_tab('screen_weigh')
         screen.ids.lbl_name.text = self.fix_text(product['name'])
         screen.ids.lbl_price_unit.text = f"{product['price']:.2f} DA"
+        self.price_cents = to_cents(product['price'])
         self.clear_weight()
 
+    def refresh_favorites(self):
+        if not self.plu_index:
+            return
+        from kivymd.uix.button import MDRaisedButton
+        box = self.scale_screen().ids.favorites_box
+        box.clear_widgets()
+        count = 0
+        for pid, n in sorted(self.usage.items(), key=lambda item: -item[1]):
+            product = self.plu_index.get(pid)
+            if product is None:
+                continue
+            box.add_widget(MDRaisedButton(text=self.fix_text(product['name'][:18]), font_name='AppFont', md_bg_color=(1, 1, 1, 1), text_color=(0, 0, 0, 1), elevation=1, on_release=lambda x, p=product: self.select_product(p)))
+            count += 1
+            if count >= self.favorites_size:
+                break
+        self.has_favorites = count > 0
+
+    def record_usage(self, product):
+        pid = product['id']
+        self.usage[pid] = self.usage.get(pid, 0) + 1
+        if self.catalog_store:
+            self.catalog_store.run_async(self.catalog_store.bump_usage, pid)
+        self.refresh_favorites()
+
+    def add_plu_digit(self, digit):
+        if not self.plu_index or len(self.plu_code) >= 13:
+            return
+        self.plu_code += digit
+        self.resolve_plu()
+
+    def resolve_plu(self, final=False):
+        # Resolves as soon as the code is unique; a code that is also the
+        # start of a longer one waits for plu_timeout without a keypress.
+        if self.plu_event:
+            self.plu_event.cancel()
+            self.plu_event = None
+        code = self.plu_code
+        self.scale_screen().ids.lbl_name.text = f'PLU : {code}' if code else '---'
+        if not code:
+            return
+        product, ambiguous = self.plu_index.lookup(code)
+        if product is not None and (final or not ambiguous):
+            self.select_product(product)
+        elif not ambiguous:
+            from kivymd.toast import toast
+            toast(f'PLU {code} inconnu')
+            self.clear_plu()
+        elif product is not None:
+            self.plu_event = Clock.schedule_once(lambda dt: self.resolve_plu(final=True), self.plu_timeout)
+
+    def clear_plu(self):
+        if self.plu_event:
+            self.plu_event.cancel()
+            self.plu_event = None
+        if self.plu_code:
+            self.plu_code = ''
+            if not self.selected_product:
+                self.scale_screen().ids.lbl_name.text = '---'
+
     def add_digit(self, digit):
         if not self.selected_product:
+            self.add_plu_digit(digit)
             return
-        screen = self.root.get_screen('scale')
+        screen = self.scale_screen()
         curr = screen.ids.txt_weight.text
         if len(curr) >= 5:
             return
@@ -592,63 +1497,119 @@ class ScaleApp(MDApp):
         self.calculate_total()
 
     def backspace(self):
-        screen = self.root.get_screen('scale')
+        if not self.selected_product:
+            self.plu_code = self.plu_code[:-1]
+            if self.plu_index:
+                self.resolve_plu()
+            return
+        screen = self.scale_screen()
         curr = screen.ids.txt_weight.text
         if curr:
             screen.ids.txt_weight.text = curr[:-1]
             self.calculate_total()
 
     def clear_weight(self):
-        self.root.get_screen('scale').ids.txt_weight.text = ''
+        self.clear_plu()
+        self.scale_screen().ids.txt_weight.text = ''
         self.calculate_total()
 
     def calculate_total(self):
-        screen = self.root.get_screen('scale')
+        screen = self.scale_screen()
         w_str = screen.ids.txt_weight.text
         try:
             if not w_str:
                 screen.ids.lbl_total.text = '0.00 DA'
                 return
-            weight = float(w_str)
-            price = self.selected_product['price']
-            total = weight / 1000.0 * price
-            from decimal import Decimal, ROUND_HALF_UP
-            d_total = Decimal(str(total)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            screen.ids.lbl_total.text = f'{d_total} DA'
+            screen.ids.lbl_total.text = f'{format_cents(compute_total_cents(self.price_cents, int(w_str)))} DA'
         except:
             screen.ids.lbl_total.text = '0.00 DA'
 
-    def send_print_command(self):
+    def change_copies(self, step):
+        self.label_copies = max(1, min(self.max_copies, self.label_copies + step))
+
+    def reset_batch(self):
+        self.print_batch = []
+        self.label_copies = 1
+        self.update_batch_status()
+
+    def update_batch_status(self):
+        if not self.print_batch:
+            self.batch_status = ''
+            return
+        labels = sum(l['copies'] for l in self.print_batch)
+        self.batch_status = f'Lot : {len(self.print_batch)} pesée(s), {labels} étiquette(s)'
+
+    def add_to_batch(self):
         if not self.selected_product:
             self.show_alert('Attention', 'Veuillez sélectionner un produit')
             return
-        w_str = self.root.get_screen('scale').ids.txt_weight.text
+        w_str = self.scale_screen().ids.txt_weight.text
         if not w_str:
             self.show_alert('Attention', 'Veuillez saisir le poids')
             return
-        try:
-            w_mm, h_mm = map(int, self.sticker_size.split('x'))
-        except:
-            w_mm, h_mm = (40, 20)
-        data = json.dumps({'product_id': self.selected_product['id'], 'weight': int(w_str), 'width_mm': w_mm, 'height_mm': h_mm})
-        self.dialog_loading = MDDialog(text='Impression en cours...', auto_dismiss=False)
-        self.dialog_loading.open()
-        self.send_request('/api/print_scale_label', 'POST', data, on_success=self.on_print_success, on_failure=self.on_print_fail)
+        self.print_batch.append({'weight': int(w_str), 'copies': int(self.label_copies)})
+        self.label_copies = 1
+        self.clear_weight()
+        self.update_batch_status()
 
-    def on_print_success(self, req, res):
-        if self.dialog_loading:
-            self.dialog_loading.dismiss()
-        self.show_alert('Succès', 'Commande envoyée')
+    def send_print_command(self):
+        if not self.selected_product:
+            self.show_alert('Attention', 'Veuillez sélectionner un produit')
+            return
+        w_str = self.scale_screen().ids.txt_weight.text
+        if not w_str and not self.print_batch:
+            self.show_alert('Attention', 'Veuillez saisir le poids')
+            return
+        w_mm, h_mm = parse_size(self.sticker_size)
+        labels = list(self.print_batch)
+        if w_str:
+            labels.append({'weight': int(w_str), 'copies': int(self.label_copies)})
+        product = self.selected_product
+        payload = {'product_id': product['id'], 'width_mm': w_mm, 'height_mm': h_mm, 'name': product.get('name', ''), 'ref': product.get('ref', ''), 'price': product.get('price', 0)}
+        if len(labels) == 1 and labels[0]['copies'] == 1:
+            payload['weight'] = labels[0]['weight']
+        else:
+            payload['labels'] = labels
+        self.print_outbox.enqueue(payload)
+        self.record_usage(product)
+        self.on_print_queued()
+
+    def on_print_queued(self):
+        if not self.is_connected and self.print_outbox.direct is None:
+            from kivymd.toast import toast
+            toast(f'Hors ligne : {self.pending_prints} impression(s) en attente')
+        self.reset_batch()
         self.clear_weight()
         self.selected_product = None
-        self.root.get_screen('scale').ids.bottom_nav.switch_tab('screen_products')
+        self.scale_screen().ids.bottom_nav.switch_tab('screen_products')
 
-    def on_print_fail(self, req, err):
-        if self.dialog_loading:
-            self.dialog_loading.dismiss()
-        self.show_alert('Erreur', "Vérifiez l'imprimante ou la connexion")
+    def on_print_progress(self, key, done, total):
+        if total <= 1:
+            return
+        from kivymd.toast import toast
+        if done >= total:
+            toast(f'{total} étiquettes imprimées')
+        elif done % 10 == 0:
+            toast(f'Impression : {done}/{total} étiquettes')
+
+    def on_labels_printed(self, printed):
+        for payload, created in printed:
+            self.journal.append(entries_from_payload(payload, created))
+
+    def note_activity(self, *args):
+        self.last_activity = time.monotonic()
+
+    def is_idle(self):
+        # Nobody touched the screen for a while and no label is queued.
+        return time.monotonic() - self.last_activity > self.idle_after and not self.pending_prints and not self.print_batch
+
+    def on_print_rejected(self, key, error):
+        log_msg('Print job %s rejected: %s', key, error, level='ERROR')
+        self.show_alert('Erreur', f"Étiquette refusée par le serveur :\n{error}")
 
     def show_alert(self, title, text):
+        from kivymd.uix.button import MDFlatButton
+        from kivymd.uix.dialog import MDDialog
         if self.dialog:
             self.dialog.dismiss()
         self.dialog = MDDialog(title=title, text=text, buttons=[MDFlatButton(text='OK', on_release=lambda x: self.dialog.dismiss())])
@@ -658,4 +1619,4 @@ if __name__ == '__main__':
     try:
         ScaleApp().run()
     except Exception as e:
-        log_msg(f'MAIN ERROR: {traceback.format_exc()}', 'CRITICAL')
+        log_msg('MAIN ERROR: %s', traceback.format_exc(), level='CRITICAL')
@@ -0,0 +1,567 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import http.client
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+
+# ============================================
+class HttpError(Exception):
+
+    def __init__(self, status, result=None):
+        super().__init__(f'HTTP {status}')
+        self.status = status
+        self.result = result
+
+class HttpRequest:
+
+    def __init__(self, url, method='GET', body=None, headers=None, timeout=None):
+        self.url = url
+        self.method = method
+        self.body = body
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.resp_status = None
+        self.resp_headers = {}
+        self.result = None
+        self.error = None
+        self.elapsed = None
+        self.latency = None
+        self.is_finished = False
+
+def decode_body(headers, data):
+    ctype = ''
+    for k, v in headers.items():
+        if k.lower() == 'content-type':
+            ctype = v.lower()
+            break
+    if 'json' in ctype and data:
+        try:
+            return json.loads(data.decode('utf-8'))
+        except ValueError:
+            return data
+    return data
+
+# ============================================
+class HttpClient:
+
+    def __init__(self, workers=4, timeout=2, dispatch=None, max_idle_per_host=4):
+        self.timeout = timeout
+        self.dispatch = dispatch
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+
+    def _acquire(self, host, port, timeout):
+        with self._lock:
+            idle = self._idle.get((host, port))
+            if idle:
+                return idle.pop(), True
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def _release(self, host, port, conn):
+        with self._lock:
+            idle = self._idle.setdefault((host, port), [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def perform(self, url, method='GET', body=None, headers=None, timeout=None):
+        return self._perform(url, method, body, headers, timeout)[:3]
+
+    def _perform(self, url, method='GET', body=None, headers=None, timeout=None):
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        timeout = timeout or self.timeout
+        for attempt in range(2):
+            conn, reused = self._acquire(host, port, timeout)
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                latency = time.perf_counter() - start
+                data = resp.read()
+            except STALE_ERRORS:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(host, port, conn)
+            return resp.status, dict(resp.getheaders()), data, latency
+
+    def fetch(self, url, timeout=None):
+        status, _, data = self.perform(url, timeout=timeout)
+        if status >= 400:
+            raise HttpError(status)
+        return data
+
+    def request(self, url, method='GET', body=None, headers=None, on_success=None, on_failure=None, on_error=None, timeout=None, decode=True):
+        req = HttpRequest(url, method, body, headers, timeout or self.timeout)
+        self._executor.submit(self._run, req, on_success, on_failure, on_error, decode)
+        return req
+
+    def _run(self, req, on_success, on_failure, on_error, decode=True):
+        start = time.perf_counter()
+        try:
+            status, headers, data, req.latency = self._perform(req.url, req.method, req.body, req.headers, req.timeout)
+            req.resp_status = status
+            req.resp_headers = headers
+            req.result = decode_body(headers, data) if decode or status >= 400 else data
+            callback, arg = (on_success, req.result) if status < 400 else (on_failure, req.result)
+        except Exception as e:
+            req.error = e
+            callback, arg = on_error, e
+        req.elapsed = time.perf_counter() - start
+        req.is_finished = True
+        if callback is None:
+            return
+        if self.dispatch:
+            self.dispatch(lambda: callback(req, arg))
+        else:
+            callback(req, arg)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+        self._executor.shutdown(wait=False)
+
+# ============================================
+class Endpoint:
+
+    def __init__(self, ip, priority):
+        self.ip = ip
+        self.priority = priority
+        self.rtt = None
+        self.healthy = True
+        self.failures = 0
+        self.successes = 0
+        self.last_success = 0
+        self.last_failure = 0
+
+    def sort_key(self):
+        return (not self.healthy, self.rtt if self.rtt is not None else float('inf'), self.priority)
+
+class EndpointManager:
+    ALPHA = 0.3
+
+    def __init__(self, ips=()):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.set_ips(ips)
+
+    def set_ips(self, ips):
+        with self._lock:
+            old = self._endpoints
+            self._endpoints = {}
+            for priority, ip in enumerate(dict.fromkeys(ips)):
+                ep = old.get(ip) or Endpoint(ip, priority)
+                ep.priority = priority
+                self._endpoints[ip] = ep
+
+    def ordered(self):
+        with self._lock:
+            return [ep.ip for ep in sorted(self._endpoints.values(), key=Endpoint.sort_key)]
+
+    def best(self):
+        ips = self.ordered()
+        return ips[0] if ips else None
+
+    def ips(self):
+        with self._lock:
+            return list(self._endpoints)
+
+    def needs_race(self):
+        with self._lock:
+            return not any((ep.healthy and ep.rtt is not None for ep in self._endpoints.values()))
+
+    def all_healthy(self):
+        with self._lock:
+            return all((ep.healthy for ep in self._endpoints.values()))
+
+    def any_healthy(self):
+        with self._lock:
+            return any((ep.healthy and ep.successes for ep in self._endpoints.values()))
+
+    def record_success(self, ip, rtt):
+        with self._lock:
+            ep = self._endpoints.get(ip)
+            if ep is None:
+                return
+            ep.rtt = rtt if ep.rtt is None else ep.rtt + self.ALPHA * (rtt - ep.rtt)
+            ep.healthy = True
+            ep.failures = 0
+            ep.successes += 1
+            ep.last_success = time.monotonic()
+
+    def note_rtt(self, ip, rtt):
+        # A hint from outside the request path (discovery): only orders
+        # endpoints nothing has been measured for yet.
+        with self._lock:
+            ep = self._endpoints.get(ip)
+            if ep is not None and ep.rtt is None:
+                ep.rtt = rtt
+
+    def record_failure(self, ip):
+        with self._lock:
+            ep = self._endpoints.get(ip)
+            if ep is None:
+                return
+            ep.healthy = False
+            ep.failures += 1
+            ep.last_failure = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            return [{'ip': ep.ip, 'rtt_ms': round(ep.rtt * 1000, 1) if ep.rtt is not None else None, 'healthy': ep.healthy, 'failures': ep.failures} for ep in sorted(self._endpoints.values(), key=Endpoint.sort_key)]
+
+# ============================================
+class ApiClient:
+    RACE_METHODS = ('GET', 'HEAD')
+
+    def __init__(self, http, endpoints, port, timeout=2, on_reachable=None, on_unreachable=None, telemetry=None):
+        self.http = http
+        self.endpoints = endpoints
+        self.port = port
+        self.timeout = timeout
+        self.on_reachable = on_reachable
+        self.on_unreachable = on_unreachable
+        self.telemetry = telemetry
+        self._lock = threading.Lock()
+
+    def url(self, ip, endpoint):
+        return f'http://{ip}:{self.port}{endpoint}'
+
+    def request(self, endpoint, method='GET', body=None, headers=None, on_success=None, on_failure=None, timeout=None, idempotent=None, decode=True):
+        ips = self.endpoints.ordered()
+        if not ips:
+            if on_failure:
+                on_failure(None, 'Aucune IP configurée')
+            return
+        if idempotent is None:
+            idempotent = method in self.RACE_METHODS
+        call = {'endpoint': endpoint, 'method': method, 'body': body, 'headers': headers, 'on_success': on_success, 'on_failure': on_failure, 'timeout': timeout or self.timeout, 'idempotent': idempotent, 'decode': decode, 'done': False, 'started': time.monotonic()}
+        if idempotent and len(ips) > 1 and self.endpoints.needs_race():
+            self._count('race')
+            self._race(call, ips)
+        else:
+            self._attempt(call, ips)
+
+    def probe(self, endpoint, method='HEAD', on_complete=None, timeout=None):
+        ips = self.endpoints.ips()
+        if not ips:
+            if on_complete:
+                on_complete(False)
+            return
+        state = {'pending': len(ips), 'reached': False}
+        for ip in ips:
+            reached = partial(self._on_probe, ip, True, state, on_complete)
+            self.http.request(self.url(ip, endpoint), method, on_success=reached, on_failure=reached, on_error=partial(self._on_probe, ip, False, state, on_complete), timeout=timeout or self.timeout)
+
+    def _on_probe(self, ip, reached, state, on_complete, req, result):
+        if reached:
+            self.endpoints.record_success(ip, req.latency or 0)
+        else:
+            self.endpoints.record_failure(ip)
+        with self._lock:
+            state['pending'] -= 1
+            state['reached'] = state['reached'] or reached
+            last = state['pending'] == 0
+        if last and on_complete:
+            on_complete(state['reached'])
+
+    def _count(self, name):
+        if self.telemetry is not None:
+            self.telemetry.incr(name)
+
+    def _send(self, call, ip, on_response, on_error):
+        self.http.request(self.url(ip, call['endpoint']), call['method'], call['body'], call['headers'], on_success=on_response, on_failure=on_response, on_error=on_error, timeout=call['timeout'], decode=call['decode'])
+
+    def _on_response(self, call, ip, req, result):
+        self.endpoints.record_success(ip, req.latency or 0)
+        self._finish(call, req, result, req.resp_status < 400)
+
+    def _attempt(self, call, ips):
+        ip, rest = ips[0], ips[1:]
+
+        def on_error(req, error):
+            self.endpoints.record_failure(ip)
+            if not rest:
+                self._finish(call, req, 'Connexion perdue', False, reachable=False)
+                return
+            self._count('failover')
+            if call['idempotent'] and len(rest) > 1:
+                self._race(call, rest)
+            else:
+                self._attempt(call, rest)
+        self._send(call, ip, partial(self._on_response, call, ip), on_error)
+
+    def _race(self, call, ips):
+        pending = {'count': len(ips)}
+
+        def on_error(ip, req, error):
+            self.endpoints.record_failure(ip)
+            with self._lock:
+                pending['count'] -= 1
+                last = pending['count'] == 0
+            if last:
+                self._finish(call, req, 'Connexion perdue', False, reachable=False)
+        for ip in ips:
+            self._send(call, ip, partial(self._on_response, call, ip), partial(on_error, ip))
+
+    def _finish(self, call, req, result, ok, reachable=True):
+        with self._lock:
+            if call['done']:
+                return
+            call['done'] = True
+        if self.telemetry is not None:
+            path = call['endpoint'].split('?', 1)[0]
+            self.telemetry.record(f"{call['method']} {path}", (time.monotonic() - call['started']) * 1000, error=not ok)
+        notify = self.on_reachable if reachable else self.on_unreachable
+        if notify:
+            notify()
+        callback = call['on_success'] if ok else call['on_failure']
+        if callback:
+            callback(req, result)
+
+# ============================================
+def thread_schedule(delay, fn):
+    timer = threading.Timer(delay, fn)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+class ConnectivityMonitor:
+
+    def __init__(self, api, schedule=thread_schedule, ping_endpoint='/api/ping', min_interval=5, max_interval=60, retry_interval=1, on_change=None):
+        self.api = api
+        self.schedule = schedule
+        self.ping_endpoint = ping_endpoint
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.retry_interval = retry_interval
+        self.on_change = on_change
+        self.online = False
+        self.paused = True
+        self.interval = retry_interval
+        self.probes = 0
+        self.last_traffic = 0
+        self._probing = False
+        self._handle = None
+        self._lock = threading.RLock()
+
+    def start(self):
+        with self._lock:
+            self.paused = False
+            self._reschedule(0)
+
+    def pause(self):
+        with self._lock:
+            self.paused = True
+            self._cancel()
+
+    def resume(self):
+        self.start()
+
+    def note_success(self):
+        with self._lock:
+            self.last_traffic = time.monotonic()
+        self._set_online(True)
+
+    def note_failure(self):
+        with self._lock:
+            self.interval = self.retry_interval
+            if not self.paused:
+                self._reschedule(self.retry_interval)
+        self._set_online(False)
+
+    def _set_online(self, online):
+        with self._lock:
+            changed = online != self.online
+            self.online = online
+        if changed and self.on_change:
+            self.on_change(online)
+
+    def _cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _reschedule(self, delay):
+        self._cancel()
+        self._handle = self.schedule(delay, self._tick)
+
+    def _tick(self, *args):
+        with self._lock:
+            self._handle = None
+            if self.paused or self._probing:
+                return
+            idle = time.monotonic() - self.last_traffic
+            if self.online and idle < self.interval and self.api.endpoints.all_healthy():
+                self._reschedule(self.interval - idle)
+                return
+            self._probing = True
+            self.probes += 1
+        self.api.probe(self.ping_endpoint, 'HEAD', on_complete=self._on_probe_done, timeout=1.5)
+
+    def _on_probe_done(self, reached):
+        with self._lock:
+            self._probing = False
+            if reached:
+                self.last_traffic = time.monotonic()
+                self.interval = min(max(self.interval * 2, self.min_interval), self.max_interval)
+            else:
+                self.interval = min(self.interval * 2, self.min_interval)
+            if not self.paused:
+                self._reschedule(self.interval)
+        self._set_online(reached)
+
+# ============================================
+class SseParser:
+    # text/event-stream framing: "field: value" lines, events end at a
+    # blank line, lines starting with ":" are comments (keep-alives).
+
+    def __init__(self):
+        self._data = []
+        self._event = ''
+        self.last_id = None
+        self.retry = None
+
+    def feed_line(self, line):
+        line = line.rstrip('\r\n')
+        if not line:
+            if not self._data:
+                self._event = ''
+                return None
+            event = {'event': self._event or 'message', 'data': '\n'.join(self._data), 'id': self.last_id}
+            self._data = []
+            self._event = ''
+            return event
+        if line.startswith(':'):
+            return None
+        field, _, value = line.partition(':')
+        if value.startswith(' '):
+            value = value[1:]
+        if field == 'data':
+            self._data.append(value)
+        elif field == 'event':
+            self._event = value
+        elif field == 'id':
+            self.last_id = value
+        elif field == 'retry' and value.isdigit():
+            self.retry = int(value) / 1000
+        return None
+
+class EventStream:
+    # One long-lived GET per scale. The server sends a comment line every
+    # few seconds, so a read timeout means the link is dead, not idle.
+
+    def __init__(self, url_for, on_event, on_status=None, on_traffic=None, read_timeout=35, min_retry=1, max_retry=30):
+        self.url_for = url_for
+        self.on_event = on_event
+        self.on_status = on_status
+        self.on_traffic = on_traffic
+        self.read_timeout = read_timeout
+        self.min_retry = min_retry
+        self.max_retry = max_retry
+        self.connected = False
+        self.events = 0
+        self._parser = SseParser()
+        self._conn = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._loop, name='event-stream', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread = None
+        conn = self._conn
+        if conn is not None and conn.sock is not None:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _set_connected(self, connected, error=None):
+        if connected != self.connected or error is not None:
+            self.connected = connected
+            if self.on_status:
+                self.on_status(connected, error)
+
+    def _loop(self):
+        delay = self.min_retry
+        while not self._stopped.is_set():
+            url = self.url_for()
+            try:
+                if not url:
+                    raise OSError('no endpoint')
+                self._read(url)
+            except Exception as e:
+                if self._stopped.is_set():
+                    break
+                if self.connected:
+                    delay = self._parser.retry or self.min_retry
+                else:
+                    delay = min(delay * 2, self.max_retry)
+                self._set_connected(False, e)
+            finally:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+            self._stopped.wait(delay)
+        self.connected = False
+
+    def _read(self, url):
+        parts = urlsplit(url)
+        path = parts.path + (f'?{parts.query}' if parts.query else '')
+        headers = {'Accept': 'text/event-stream', 'Cache-Control': 'no-cache'}
+        if self._parser.last_id:
+            headers['Last-Event-ID'] = self._parser.last_id
+        self._conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=self.read_timeout)
+        self._conn.request('GET', path, headers=headers)
+        resp = self._conn.getresponse()
+        if resp.status != 200:
+            raise HttpError(resp.status)
+        self._set_connected(True)
+        while not self._stopped.is_set():
+            line = resp.readline()
+            if not line:
+                raise OSError('event stream closed')
+            if self.on_traffic:
+                self.on_traffic()
+            event = self._parser.feed_line(line.decode('utf-8', 'replace'))
+            if event is not None:
+                self.events += 1
+                try:
+                    event['data'] = json.loads(event['data'])
+                except ValueError:
+                    pass
+                self.on_event(event)
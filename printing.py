@@ -0,0 +1,473 @@
+from collections import OrderedDict
+from decimal import Decimal, ROUND_HALF_UP
+import json
+import queue
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+from net import thread_schedule
+
+PRINT_ENDPOINT = '/api/print_scale_label'
+BATCH_ENDPOINT = '/api/print_scale_label_batch'
+MULTI_ENDPOINT = '/api/print_scale_labels'
+
+# ============================================
+def is_multi(payload):
+    return 'labels' in payload
+
+def expand_labels(payload):
+    if not is_multi(payload):
+        return [payload]
+    base = {k: v for k, v in payload.items() if k not in ('labels', 'idempotency_key')}
+    flat = []
+    for label in payload['labels']:
+        for _ in range(max(1, int(label.get('copies', 1)))):
+            flat.append(dict(base, weight=label['weight']))
+    return flat
+
+def label_count(payload):
+    return len(expand_labels(payload)) if is_multi(payload) else 1
+
+def parse_size(size, default=(40, 20)):
+    try:
+        w_mm, h_mm = map(int, str(size).lower().split('x'))
+        return w_mm, h_mm
+    except Exception:
+        return default
+
+# One total engine for the screen, the labels and the sales journal: the
+# price/kg is rounded half-up to cents once, then price * grams is rounded
+# half-up in integers, so every place agrees even for prices with more
+# than two decimals.
+def to_cents(price):
+    return int(Decimal(str(price)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) * 100)
+
+def compute_total_cents(price_cents, grams):
+    return (price_cents * grams + 500) // 1000
+
+def format_cents(cents):
+    return f'{cents // 100}.{cents % 100:02d}'
+
+def label_total(price, weight):
+    return format_cents(compute_total_cents(to_cents(price), int(weight)))
+
+# ============================================
+class LabelTemplate:
+
+    def __init__(self, language, w_mm, h_mm, dpi):
+        self.language = language
+        dpm = dpi / 25.4
+        self.width = int(w_mm * dpm)
+        self.height = int(h_mm * dpm)
+        pad = int(1.5 * dpm)
+        self.name_box = (pad, pad, self.width - 2 * pad, int(self.height * 0.3))
+        self.small = max(16, int(self.height * 0.14))
+        self.large = max(24, int(self.height * 0.24))
+        y_weight = pad + self.name_box[3] + pad
+        y_total = self.height - pad - self.large
+        if language == 'zpl':
+            self.header = f'^XA^CI28^PW{self.width}^LL{self.height}^LH0,0'.encode()
+            self.fields = (f'^FO{pad},{y_weight}^A0N,{self.small},{self.small}^FD{{weight}}^FS'
+                           f'^FO{self.width // 2},{y_weight}^A0N,{self.small},{self.small}^FD{{price}}^FS'
+                           f'^FO{pad},{y_total}^A0N,{self.large},{self.large}^FD{{total}}^FS'
+                           '^PQ{copies}^XZ')
+        else:
+            small = self._tspl_font(self.small)
+            large = self._tspl_font(self.large)
+            self.header = f'SIZE {w_mm} mm,{h_mm} mm\r\nGAP 2 mm,0 mm\r\nDIRECTION 1\r\nCODEPAGE UTF-8\r\nCLS\r\n'.encode()
+            self.fields = (f'TEXT {pad},{y_weight},"{small}",0,1,1,"{{weight}}"\r\n'
+                           f'TEXT {self.width // 2},{y_weight},"{small}",0,1,1,"{{price}}"\r\n'
+                           f'TEXT {pad},{y_total},"{large}",0,1,1,"{{total}}"\r\n'
+                           'PRINT 1,{copies}\r\n')
+
+    def _tspl_font(self, px):
+        # Built-in TSPL fonts "1".."5" are 12, 20, 24, 32 and 48 dots high.
+        best = '1'
+        for font, height in (('1', 12), ('2', 20), ('3', 24), ('4', 32), ('5', 48)):
+            if height <= px:
+                best = font
+        return best
+
+    def text(self, x, y, px, value):
+        value = str(value).replace('"', "'")
+        if self.language == 'zpl':
+            # ^ and ~ would start a command inside ^FD; ^FH lets them (and
+            # the _ escape character itself) through as _XX hex.
+            value = ''.join(f'_{ord(c):02X}' if c in '^~_' else c for c in value)
+            return f'^FO{x},{y}^A0N,{px},{px}^FH^FD{value}^FS'.encode()
+        return f'TEXT {x},{y},"{self._tspl_font(px)}",0,1,1,"{value}"\r\n'.encode()
+
+    def bitmap(self, x, y, image):
+        width_bytes = (image.width + 7) // 8
+        if self.language == 'zpl':
+            # ZPL prints set bits, Pillow's mode "1" stores white as set.
+            data = bytes(b ^ 0xFF for b in image.tobytes())
+            return f'^FO{x},{y}^GFA,{len(data)},{len(data)},{width_bytes},{data.hex().upper()}^FS'.encode()
+        return f'BITMAP {x},{y},{width_bytes},{image.height},0,'.encode() + image.tobytes() + b'\r\n'
+
+class LabelRenderer:
+    LANGUAGES = ('tspl', 'zpl')
+
+    def __init__(self, language='tspl', dpi=203, font_path=None, shaper=None, maxsize=256):
+        self.language = language if language in self.LANGUAGES else 'tspl'
+        self.dpi = dpi
+        self.font_path = font_path
+        self.shaper = shaper
+        self.maxsize = maxsize
+        self._templates = {}
+        self._fonts = {}
+        self._names = OrderedDict()
+        self._lock = threading.Lock()
+
+    def template(self, w_mm, h_mm):
+        key = (w_mm, h_mm)
+        tpl = self._templates.get(key)
+        if tpl is None:
+            tpl = self._templates[key] = LabelTemplate(self.language, w_mm, h_mm, self.dpi)
+        return tpl
+
+    def _font(self, px):
+        font = self._fonts.get(px)
+        if font is None:
+            try:
+                font = ImageFont.truetype(self.font_path, px) if self.font_path else ImageFont.load_default()
+            except Exception:
+                font = ImageFont.load_default()
+            self._fonts[px] = font
+        return font
+
+    def _name_bitmap(self, tpl, name):
+        key = (tpl.width, tpl.height, name)
+        with self._lock:
+            img = self._names.get(key)
+            if img is not None:
+                self._names.move_to_end(key)
+                return img
+        _, _, w, h = tpl.name_box
+        text = self.shaper.shape(name) if self.shaper else name
+        px = h
+        font = self._font(px)
+        while px > 10 and font.getlength(text) > w:
+            px -= 2
+            font = self._font(px)
+        img = Image.new('1', (w, h), 1)
+        ImageDraw.Draw(img).text((w // 2, h // 2), text, font=font, fill=0, anchor='mm')
+        with self._lock:
+            self._names[key] = img
+            while len(self._names) > self.maxsize:
+                self._names.popitem(last=False)
+        return img
+
+    def _name_field(self, tpl, name):
+        x, y, _, h = tpl.name_box
+        if Image is not None and (self.font_path or not name.isascii()):
+            return tpl.bitmap(x, y, self._name_bitmap(tpl, name))
+        return tpl.text(x, y, h, name.encode('ascii', 'replace').decode())
+
+    def render(self, name, price, weight, copies=1, size='40x20'):
+        tpl = self.template(*parse_size(size))
+        fields = tpl.fields.format(weight=f'{int(weight) / 1000:.3f} kg', price=f'{float(price):.2f} DA/kg', total=f'{label_total(price, weight)} DA', copies=max(1, int(copies)))
+        return tpl.header + self._name_field(tpl, str(name or '')) + fields.encode('utf-8')
+
+    def render_job(self, payload, skip=0):
+        size = f"{payload.get('width_mm', 40)}x{payload.get('height_mm', 20)}"
+        name = payload.get('name', '')
+        price = payload['price']
+        if not is_multi(payload):
+            return self.render(name, price, payload['weight'], payload.get('copies', 1), size)
+        out = []
+        for label in payload['labels']:
+            copies = max(1, int(label.get('copies', 1)))
+            if skip >= copies:
+                skip -= copies
+                continue
+            out.append(self.render(name, price, label['weight'], copies - skip, size))
+            skip = 0
+        return b''.join(out)
+
+# ============================================
+class RawPrinter:
+
+    def __init__(self, host, port=9100, timeout=3):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+
+    def send(self, data):
+        # One connection per job: a kept-alive socket the printer has
+        # silently dropped would swallow the next label.
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as sock:
+            sock.sendall(data)
+            try:
+                sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+        return len(data)
+
+class DirectResult:
+
+    def __init__(self, resp_status=None):
+        self.resp_status = resp_status
+
+class DirectPrinter:
+
+    def __init__(self, printer, renderer, dispatch=None):
+        self.printer = printer
+        self.renderer = renderer
+        self.dispatch = dispatch or (lambda fn: fn())
+        self._jobs = queue.Queue()
+        self._thread = None
+
+    def submit(self, payload, skip=0, on_success=None, on_failure=None):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='direct-printer', daemon=True)
+            self._thread.start()
+        self._jobs.put((payload, skip, on_success, on_failure))
+
+    def _loop(self):
+        while True:
+            payload, skip, on_success, on_failure = self._jobs.get()
+            try:
+                data = self.renderer.render_job(payload, skip)
+            except Exception as e:
+                # A label that cannot be rendered never will be: reject it
+                # like the server would instead of retrying forever.
+                if on_failure:
+                    self.dispatch(lambda e=e: on_failure(DirectResult(422), e))
+                continue
+            try:
+                self.printer.send(data)
+            except OSError as e:
+                if on_failure:
+                    self.dispatch(lambda e=e: on_failure(DirectResult(), e))
+                continue
+            if on_success:
+                self.dispatch(on_success)
+
+# ============================================
+class PrintOutbox:
+    RETRY_MIN = 2
+    RETRY_MAX = 60
+
+    def __init__(self, path, api, schedule=thread_schedule, batch_size=10, on_change=None, on_dead=None, on_progress=None, on_printed=None):
+        self.path = path
+        self.api = api
+        self.schedule = schedule
+        self.batch_size = batch_size
+        self.on_change = on_change
+        self.on_dead = on_dead
+        self.on_progress = on_progress
+        self.on_printed = on_printed
+        self.batch_supported = True
+        self.multi_supported = True
+        self.direct = None
+        self.flushing = False
+        self.delivered = 0
+        self.retry_delay = self.RETRY_MIN
+        self._retry_handle = None
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=FULL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS jobs (seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE, payload TEXT, created REAL, attempts INTEGER DEFAULT 0, state TEXT DEFAULT \'pending\', last_error TEXT)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, seq)')
+        if 'sent' not in [row[1] for row in self._conn.execute('PRAGMA table_info(jobs)')]:
+            self._conn.execute('ALTER TABLE jobs ADD COLUMN sent INTEGER DEFAULT 0')
+        self._conn.commit()
+
+    def enqueue(self, payload):
+        key = uuid.uuid4().hex
+        payload = dict(payload, idempotency_key=key)
+        with self._lock, self._conn:
+            self._conn.execute('INSERT INTO jobs (key, payload, created) VALUES (?, ?, ?)', (key, json.dumps(payload), time.time()))
+        self._changed()
+        self.flush()
+        return key
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'pending'").fetchone()[0]
+
+    def dead_jobs(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, payload, last_error FROM jobs WHERE state = 'dead' ORDER BY seq").fetchall()
+        return [{'key': k, 'payload': json.loads(p), 'error': e} for k, p, e in rows]
+
+    def _next_jobs(self, limit):
+        with self._lock:
+            rows = self._conn.execute("SELECT key, payload, sent FROM jobs WHERE state = 'pending' ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        jobs = []
+        for key, payload, sent in rows:
+            payload = json.loads(payload)
+            if jobs and is_multi(payload):
+                break
+            jobs.append((key, payload, sent or 0))
+            if is_multi(payload):
+                break
+        return jobs
+
+    def _mark_sent(self, key, sent):
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE jobs SET sent = ? WHERE key = ?', (sent, key))
+
+    def _progress(self, key, done, total):
+        if self.on_progress:
+            self.on_progress(key, done, total)
+
+    def _mark_done(self, keys):
+        printed = []
+        with self._lock, self._conn:
+            if self.on_printed:
+                for k in keys:
+                    printed.extend(self._conn.execute('SELECT payload, created FROM jobs WHERE key = ?', (k,)))
+            self._conn.executemany('DELETE FROM jobs WHERE key = ?', ((k,) for k in keys))
+            self.delivered += len(keys)
+        if printed:
+            self.on_printed([(json.loads(payload), created) for payload, created in printed])
+
+    def _mark_dead(self, key, error):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET state = 'dead', attempts = attempts + 1, last_error = ? WHERE key = ?", (str(error), key))
+        if self.on_dead:
+            self.on_dead(key, error)
+
+    def _mark_attempt(self, keys, error):
+        with self._lock, self._conn:
+            self._conn.executemany('UPDATE jobs SET attempts = attempts + 1, last_error = ? WHERE key = ?', ((str(error), k) for k in keys))
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change(self.pending_count())
+
+    def flush(self, *args):
+        with self._lock:
+            if self.flushing:
+                return
+            if self._retry_handle is not None:
+                self._retry_handle.cancel()
+                self._retry_handle = None
+            jobs = self._next_jobs(self.batch_size if self.batch_supported and self.direct is None else 1)
+            if not jobs:
+                self.retry_delay = self.RETRY_MIN
+                return
+            self.flushing = True
+        key, payload, sent = jobs[0]
+        if self.direct is not None:
+            self.direct.submit(payload, sent, on_success=lambda: self._on_multi_sent(key, payload), on_failure=lambda req, err: self._on_failed(jobs, req, err))
+            return
+        headers = {'Content-type': 'application/json', 'Idempotency-Key': key}
+        if is_multi(payload) and self.multi_supported:
+            self.api.request(MULTI_ENDPOINT, 'POST', json.dumps(payload), headers, on_success=lambda req, res: self._on_multi_sent(key, payload), on_failure=lambda req, err: self._on_failed(jobs, req, err))
+        elif is_multi(payload):
+            labels = expand_labels(payload)
+            single = dict(labels[sent], idempotency_key=f'{key}:{sent}')
+            headers['Idempotency-Key'] = single['idempotency_key']
+            self.api.request(PRINT_ENDPOINT, 'POST', json.dumps(single), headers, on_success=lambda req, res: self._on_label_sent(key, sent + 1, len(labels)), on_failure=lambda req, err: self._on_failed(jobs, req, err))
+        elif self.batch_supported and len(jobs) > 1:
+            body = json.dumps({'jobs': [p for _, p, _ in jobs]})
+            self.api.request(BATCH_ENDPOINT, 'POST', body, {'Content-type': 'application/json'}, on_success=lambda req, res: self._on_batch_sent(jobs, res), on_failure=lambda req, err: self._on_failed(jobs, req, err))
+        else:
+            self.api.request(PRINT_ENDPOINT, 'POST', json.dumps(payload), headers, on_success=lambda req, res: self._on_sent([key]), on_failure=lambda req, err: self._on_failed(jobs, req, err))
+
+    def _on_multi_sent(self, key, payload):
+        total = label_count(payload)
+        self._progress(key, total, total)
+        self._on_sent([key])
+
+    def _on_label_sent(self, key, sent, total):
+        self._progress(key, sent, total)
+        if sent >= total:
+            self._on_sent([key])
+            return
+        self._mark_sent(key, sent)
+        with self._lock:
+            self.flushing = False
+            self.retry_delay = self.RETRY_MIN
+        self.flush()
+
+    def _on_sent(self, keys):
+        self._mark_done(keys)
+        with self._lock:
+            self.flushing = False
+            self.retry_delay = self.RETRY_MIN
+        self._changed()
+        self.flush()
+
+    def _on_batch_sent(self, jobs, res):
+        results = res.get('results') if isinstance(res, dict) else None
+        if not results:
+            self._on_sent([k for k, _, _ in jobs])
+            return
+        status = {r.get('idempotency_key'): r for r in results if isinstance(r, dict)}
+        done = []
+        for key, _, _ in jobs:
+            r = status.get(key, {'status': 'ok'})
+            if r.get('status') in ('ok', 'success', 'duplicate'):
+                done.append(key)
+            elif r.get('retry'):
+                self._mark_done(done)
+                with self._lock:
+                    self.flushing = False
+                self._changed()
+                self._schedule_retry()
+                return
+            else:
+                self._mark_dead(key, r.get('error', r.get('status')))
+        self._on_sent(done)
+
+    def _on_failed(self, jobs, req, err):
+        status = getattr(req, 'resp_status', None)
+        keys = [k for k, _, _ in jobs]
+        with self._lock:
+            self.flushing = False
+        if status in (404, 405) and is_multi(jobs[0][1]) and self.multi_supported:
+            self.multi_supported = False
+            self.flush()
+            return
+        if status in (404, 405, 501) and len(jobs) > 1:
+            # Only a missing endpoint turns batching off; any other 4xx is
+            # the server rejecting these jobs, not the batch route.
+            self.batch_supported = False
+            self.flush()
+            return
+        if status is not None and 400 <= status < 500 and len(jobs) > 1:
+            for key in keys:
+                self._mark_dead(key, err)
+            self._changed()
+            self.flush()
+            return
+        if status == 409 and is_multi(jobs[0][1]) and not self.multi_supported:
+            self._on_label_sent(keys[0], jobs[0][2] + 1, label_count(jobs[0][1]))
+            return
+        if status == 409:
+            self._on_sent(keys[:1])
+            return
+        if status is not None and 400 <= status < 500:
+            self._mark_dead(keys[0], err)
+            self._changed()
+            self.flush()
+            return
+        self._mark_attempt(keys, err or status)
+        self._schedule_retry()
+
+    def _schedule_retry(self):
+        with self._lock:
+            if self._retry_handle is not None:
+                self._retry_handle.cancel()
+            delay = self.retry_delay
+            self.retry_delay = min(self.retry_delay * 2, self.RETRY_MAX)
+            self._retry_handle = self.schedule(delay, self.flush)
+
+    def close(self):
+        with self._lock:
+            if self._retry_handle is not None:
+                self._retry_handle.cancel()
+            self._conn.close()
@@ -0,0 +1,254 @@
+import os
+import re
+import select
+import socket
+import threading
+
+try:
+    import termios
+except ImportError:
+    termios = None
+
+BAUDS = {1200: 'B1200', 2400: 'B2400', 4800: 'B4800', 9600: 'B9600', 19200: 'B19200', 38400: 'B38400', 57600: 'B57600', 115200: 'B115200'}
+UNITS = {'kg': 1000, 'g': 1, 'lb': 453.59237}
+
+# ============================================
+class FrameParser:
+    # Continuous-output indicators all send one ASCII line per reading, e.g.
+    # "ST,GS,+0001.234kg" (CAS / A&D), "S S     1.234 kg" (MT-SICS) or a bare
+    # "   1234 g". Bytes are buffered until a line ends, so a frame split
+    # across two reads is parsed once it is complete.
+    MAX_LINE = 128
+    NUMBER = re.compile(r'([-+])?\s*(\d+(?:[.,]\d+)?)\s*(kg|g|lb)?', re.I)
+
+    def __init__(self, default_unit='kg'):
+        self.default_unit = default_unit
+        self._buffer = b''
+
+    def feed(self, data):
+        buf = self._buffer + data
+        lines = re.split(b'[\r\n]+', buf)
+        self._buffer = lines.pop()
+        if len(self._buffer) > self.MAX_LINE:
+            self._buffer = b''
+        readings = []
+        for line in lines:
+            reading = self.parse_line(line.decode('ascii', 'ignore').strip())
+            if reading is not None:
+                readings.append(reading)
+        return readings
+
+    def parse_line(self, line):
+        if not line:
+            return None
+        head = line[:3].upper()
+        if head.startswith('OL') or head == 'S +' or head == 'S -':
+            return None
+        if head.startswith('ST') or head == 'S S':
+            stable = True
+        elif head.startswith('US') or head == 'S D':
+            stable = False
+        else:
+            stable = None
+        m = None
+        for m in self.NUMBER.finditer(line):
+            pass
+        if m is None:
+            return None
+        sign, number, unit = m.groups()
+        grams = float(number.replace(',', '.')) * UNITS[(unit or self.default_unit).lower()]
+        grams = int(round(grams))
+        return (-grams if sign == '-' else grams), stable
+
+class StabilityFilter:
+    # A weight is stable once the last `samples` readings stay within
+    # `tolerance_g` of each other and the indicator itself does not report
+    # motion.
+
+    def __init__(self, samples=5, tolerance_g=2):
+        self.samples = samples
+        self.tolerance_g = tolerance_g
+        self._window = []
+
+    def feed(self, grams, device_stable=None):
+        window = self._window
+        window.append(grams)
+        if len(window) > self.samples:
+            del window[0]
+        stable = len(window) == self.samples and max(window) - min(window) <= self.tolerance_g and device_stable is not False
+        return grams, stable
+
+    def reset(self):
+        self._window = []
+
+class StableTrigger:
+    # Fires once per load: after a stable weight above `min_g` it stays
+    # quiet until the platter is emptied again.
+
+    def __init__(self, min_g=20):
+        self.min_g = min_g
+        self.armed = True
+
+    def update(self, grams, stable):
+        if grams < self.min_g:
+            self.armed = True
+            return False
+        if stable and self.armed:
+            self.armed = False
+            return True
+        return False
+
+# ============================================
+class TcpSource:
+
+    def __init__(self, host, port, timeout=3):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self._sock = None
+
+    def open(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def read(self, timeout):
+        self._sock.settimeout(timeout)
+        try:
+            data = self._sock.recv(4096)
+        except socket.timeout:
+            return b''
+        if not data:
+            raise OSError('connection closed by scale')
+        return data
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def __str__(self):
+        return f'tcp://{self.host}:{self.port}'
+
+class SerialSource:
+    # Raw termios access covers USB-serial adapters and pseudo-terminals
+    # without pulling pyserial into the APK.
+
+    def __init__(self, path, baud=9600):
+        self.path = path
+        self.baud = int(baud)
+        self._fd = None
+
+    def open(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        if termios is not None:
+            try:
+                attrs = termios.tcgetattr(self._fd)
+                speed = getattr(termios, BAUDS.get(self.baud, 'B9600'))
+                attrs[0] = termios.IGNPAR
+                attrs[1] = 0
+                attrs[2] = termios.CS8 | termios.CREAD | termios.CLOCAL
+                attrs[3] = 0
+                attrs[4] = attrs[5] = speed
+                termios.tcsetattr(self._fd, termios.TCSANOW, attrs)
+            except termios.error:
+                pass
+
+    def read(self, timeout):
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return b''
+        data = os.read(self._fd, 4096)
+        if not data:
+            raise OSError('serial device closed')
+        return data
+
+    def close(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+
+    def __str__(self):
+        return f'{self.path}@{self.baud}'
+
+def open_source(spec):
+    # "tcp://192.168.1.50:4001", "192.168.1.50:4001" or "/dev/ttyUSB0@9600"
+    spec = (spec or '').strip()
+    if not spec:
+        return None
+    if spec.startswith('tcp://'):
+        spec = spec[6:]
+    if spec.startswith('/'):
+        path, _, baud = spec.partition('@')
+        return SerialSource(path, baud or 9600)
+    host, _, port = spec.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f'invalid scale source: {spec}')
+    return TcpSource(host, port)
+
+# ============================================
+class WeightStream:
+    # Reads on its own thread and keeps only the latest reading; the UI
+    # polls latest() at display rate instead of being called per frame.
+
+    def __init__(self, source, parser=None, stability=None, reconnect_delay=2, on_status=None):
+        self.source = source
+        self.parser = parser or FrameParser()
+        self.stability = stability or StabilityFilter()
+        self.reconnect_delay = reconnect_delay
+        self.on_status = on_status
+        self.connected = False
+        self.frames = 0
+        self._latest = (0, None, False)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._loop, name='scale-input', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._thread = None
+        self.source.close()
+
+    def latest(self):
+        with self._lock:
+            return self._latest
+
+    def _set_connected(self, connected, error=None):
+        self.connected = connected
+        if self.on_status:
+            self.on_status(connected, error)
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            try:
+                self.source.open()
+                self._set_connected(True)
+                while not self._stopped.is_set():
+                    for grams, device_stable in self.parser.feed(self.source.read(0.5)):
+                        grams, stable = self.stability.feed(grams, device_stable)
+                        with self._lock:
+                            self.frames += 1
+                            self._latest = (self.frames, grams, stable)
+            except (OSError, ValueError) as e:
+                self.source.close()
+                if self._stopped.is_set():
+                    break
+                self.stability.reset()
+                with self._lock:
+                    self.frames += 1
+                    self._latest = (self.frames, None, False)
+                self._set_connected(False, e)
+                self._stopped.wait(self.reconnect_delay)
+        self.connected = False
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+import threading
+
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+PROFILES = {
+    'display': {'delete_harakat': True, 'support_ligatures': True},
+    'input': {'delete_harakat': True, 'support_ligatures': False, 'use_unshaped_instead_of_isolated': True},
+}
+
+# ============================================
+def has_arabic(text):
+    return any(('\u0600' <= c <= 'ۿ' for c in text))
+
+class TextShaper:
+
+    def __init__(self, configuration, maxsize=4096):
+        self.reshaper = arabic_reshaper.ArabicReshaper(configuration=configuration)
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._shaped = OrderedDict()
+        self._reshaped = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, cache, key):
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def _store(self, cache, key, value):
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.maxsize:
+                cache.popitem(last=False)
+
+    def shape(self, text):
+        if not text or not isinstance(text, str):
+            return str(text) if text is not None else ''
+        value = self._lookup(self._shaped, text)
+        if value is not None:
+            return value
+        value = text
+        if has_arabic(text):
+            try:
+                value = get_display(self.reshaper.reshape(text))
+            except Exception:
+                value = text
+        self._store(self._shaped, text, value)
+        return value
+
+    def shape_live(self, text):
+        if not text:
+            return ''
+        value = self._lookup(self._shaped, text)
+        if value is not None:
+            return value
+        value = text
+        if has_arabic(text):
+            try:
+                value = get_display(self._reshape_incremental(text))
+            except Exception:
+                value = text
+        self._store(self._shaped, text, value)
+        return value
+
+    def _reshape_incremental(self, text):
+        # Letters never join across a space, so the reshaped form of
+        # everything up to the last word boundary can be reused as is.
+        cut = text.rfind(' ') + 1
+        if cut <= 0:
+            reshaped = self.reshaper.reshape(text)
+        else:
+            head = self._lookup(self._reshaped, text[:cut])
+            if head is None:
+                head = self.reshaper.reshape(text[:cut])
+                self._store(self._reshaped, text[:cut], head)
+            reshaped = head + self.reshaper.reshape(text[cut:])
+        self._store(self._reshaped, text, reshaped)
+        return reshaped
+
+    def reserve(self, n):
+        if n + 512 > self.maxsize:
+            self.maxsize = n + 512
+
+    def precompute(self, texts):
+        texts = list(texts)
+        self.reserve(len(texts))
+        for text in texts:
+            self.shape(text)
+
+    def clear(self):
+        with self._lock:
+            self._shaped.clear()
+            self._reshaped.clear()
+
+_shapers = {}
+_shapers_lock = threading.Lock()
+
+def get_shaper(profile='display'):
+    with _shapers_lock:
+        shaper = _shapers.get(profile)
+        if shaper is None:
+            shaper = _shapers[profile] = TextShaper(PROFILES[profile])
+        return shaper
@@ -0,0 +1,138 @@
+from array import array
+import json
+import os
+import threading
+import time
+
+# ============================================
+class RingStats:
+
+    def __init__(self, size=512):
+        self.size = size
+        self.values = array('f', bytes(4 * size))
+        self.pos = 0
+        self.count = 0
+        self.errors = 0
+        self.max = 0.0
+
+    def add(self, value, error=False):
+        self.values[self.pos] = value
+        self.pos = (self.pos + 1) % self.size
+        self.count += 1
+        if error:
+            self.errors += 1
+        if value > self.max:
+            self.max = value
+
+    def window(self):
+        return sorted(self.values[:min(self.count, self.size)])
+
+    def snapshot(self):
+        values = self.window()
+        if not values:
+            return {'count': 0, 'errors': self.errors}
+
+        def pct(p):
+            return round(values[min(len(values) - 1, int(len(values) * p / 100))], 2)
+        return {'count': self.count, 'errors': self.errors, 'p50': pct(50), 'p90': pct(90), 'p99': pct(99), 'max': round(self.max, 2)}
+
+class _NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ('telemetry', 'name', 'start')
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.telemetry.record(self.name, (time.perf_counter() - self.start) * 1000, error=exc_type is not None)
+        return False
+
+# ============================================
+class Telemetry:
+
+    def __init__(self, enabled=False, size=512):
+        self.enabled = enabled
+        self.size = size
+        self.started = time.time()
+        self.stats = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._dump_handle = None
+
+    def record(self, name, ms, error=False):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = RingStats(self.size)
+            stats.add(ms, error)
+
+    def incr(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def timer(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, name)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.counters.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            stats = {name: s.snapshot() for name, s in sorted(self.stats.items())}
+            counters = dict(sorted(self.counters.items()))
+        return {'since': round(self.started), 'now': round(time.time()), 'timings_ms': stats, 'counters': counters}
+
+    def dump(self, path):
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(tmp, path)
+
+    def start_dumps(self, schedule, path, interval=60):
+        def tick(*args):
+            if self.enabled:
+                try:
+                    self.dump(path)
+                except OSError:
+                    pass
+            self._dump_handle = schedule(interval, tick)
+        self.stop_dumps()
+        self._dump_handle = schedule(interval, tick)
+
+    def stop_dumps(self):
+        if self._dump_handle is not None:
+            self._dump_handle.cancel()
+            self._dump_handle = None
+
+    def report(self):
+        snap = self.snapshot()
+        lines = []
+        for name, s in snap['timings_ms'].items():
+            if s['count']:
+                lines.append(f"{name}: n={s['count']} err={s['errors']} p50={s['p50']} p90={s['p90']} p99={s['p99']} max={s['max']}")
+        for name, n in snap['counters'].items():
+            lines.append(f'{name}: {n}')
+        return '\n'.join(lines)
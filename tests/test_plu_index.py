@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import PluIndex
+
+# ============================================
+def test_id_prefix_of_ref_waits():
+    by_id = {'id': 1000, 'ref': ''}
+    by_ref = {'id': 7, 'ref': '100076'}
+    plu = PluIndex([by_id, by_ref])
+    assert plu.lookup('1000') == (by_id, True)
+    assert plu.lookup('100076') == (by_ref, False)
+
+def test_ref_prefix_of_id_waits():
+    by_ref = {'id': 7, 'ref': '42'}
+    by_id = {'id': 4217, 'ref': ''}
+    plu = PluIndex([by_ref, by_id])
+    assert plu.lookup('42') == (by_ref, True)
+    assert plu.lookup('4217') == (by_id, False)
+
+def test_removed_code_stops_counting():
+    short = {'id': 7, 'ref': '12'}
+    long = {'id': 8, 'ref': '123'}
+    plu = PluIndex([short, long])
+    assert plu.lookup('12') == (short, True)
+    plu.remove(long)
+    assert plu.lookup('12') == (short, False)
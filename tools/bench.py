@@ -0,0 +1,147 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import RowCache, SearchIndex, build_rows, normalize_products
+from images import image_filename
+from net import ApiClient, EndpointManager, HttpClient
+from printing import compute_total_cents, to_cents
+from shaping import TextShaper, PROFILES
+from synth import make_catalog, make_queries
+from mock_server import MockServer
+
+# ============================================
+def percentiles(samples):
+    if not samples:
+        return {}
+    s = sorted(samples)
+
+    def pct(p):
+        return round(s[min(len(s) - 1, int(len(s) * p / 100))] * 1000, 3)
+    return {'p50_ms': pct(50), 'p90_ms': pct(90), 'p99_ms': pct(99), 'max_ms': round(s[-1] * 1000, 3)}
+
+def measure(fn, *args):
+    # Timed and traced in separate runs: tracemalloc slows allocation-heavy
+    # code several times over and would swamp the timings.
+    t0 = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def stage(name, n, elapsed, peak, extra=None):
+    row = {'stage': name, 'n': n, 'total_ms': round(elapsed * 1000, 1), 'per_s': round(n / elapsed) if elapsed else None, 'peak_kb': round(peak / 1024)}
+    row.update(extra or {})
+    return row
+
+def repeat(fn, items):
+    samples = []
+    for item in items:
+        t0 = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+# ============================================
+def bench_catalog(size, queries=200):
+    raw = make_catalog(size)
+    rows = []
+    products, elapsed, peak = measure(normalize_products, raw)
+    rows.append(stage('normalize_products', size, elapsed, peak))
+    names = [p['name'] for p in products]
+    shaper = lambda: TextShaper(PROFILES['display'], maxsize=size + 512)
+    _, elapsed, peak = measure(lambda: [s.shape(n) for s in [shaper()] for n in names])
+    rows.append(stage('fix_text cold', len(names), elapsed, peak))
+    warm = shaper()
+    warm.precompute(names)
+    _, elapsed, peak = measure(lambda: [warm.shape(n) for n in names])
+    rows.append(stage('fix_text warm', len(names), elapsed, peak))
+    cached = {image_filename(p['image']): '/cache/x.jpg' for p in products[::3]}
+    image_for = lambda path: cached.get(image_filename(path), '')
+    _, elapsed, peak = measure(build_rows, products, warm.shape, image_for)
+    rows.append(stage('build_rows (update_rv)', len(products), elapsed, peak))
+    index, elapsed, peak = measure(SearchIndex, products)
+    rows.append(stage('SearchIndex build', len(products), elapsed, peak))
+    cache = RowCache(warm.shape, image_for)
+    cache.rows(products)
+    _, elapsed, peak = measure(cache.rows, products)
+    rows.append(stage('RowCache rows (cleared search)', len(products), elapsed, peak, {'cached': len(cache)}))
+    qs = make_queries(products or raw, queries)
+    samples = repeat(lambda q: cache.select(products, index.search(q)), qs)
+    rows.append(stage('filter_products + select', len(qs), sum(samples), 0, percentiles(samples)))
+    weights = [(to_cents(p['price']), 1 + i % 30000) for i, p in enumerate(products[:20000])]
+    _, elapsed, peak = measure(lambda: [compute_total_cents(cents, w) for cents, w in weights])
+    rows.append(stage('calculate_total', len(weights), elapsed, peak))
+    return rows
+
+def bench_network(size, requests=50, latency=0, jitter=0, fail_rate=0.0, drop_rate=0.0):
+    server = MockServer(items=make_catalog(size), latency_ms=latency, jitter_ms=jitter, fail_rate=fail_rate, drop_rate=drop_rate, seed=3).start()
+    http = HttpClient(workers=4, timeout=5)
+    # The second address is loopback too but nothing listens there, so
+    # every request that lands on it exercises the failover path.
+    api = ApiClient(http, EndpointManager(['127.0.0.1', '127.0.0.2']), server.port, timeout=5)
+    rows = []
+    try:
+        for endpoint, method in (('/api/ping', 'GET'), ('/api/products', 'GET')):
+            samples, failures = [], 0
+            for _ in range(requests):
+                done = threading.Event()
+                outcome = {}
+                t0 = time.perf_counter()
+
+                def finish(ok, req, res):
+                    outcome['ok'] = ok
+                    done.set()
+                api.request(endpoint, method, on_success=lambda req, res: finish(True, req, res), on_failure=lambda req, res: finish(False, req, res))
+                done.wait(30)
+                samples.append(time.perf_counter() - t0)
+                if not outcome.get('ok'):
+                    failures += 1
+            rows.append(stage(f'{method} {endpoint}', requests, sum(samples), 0, dict(percentiles(samples), failures=failures)))
+    finally:
+        http.close()
+        server.stop()
+    return rows
+
+def print_rows(title, rows):
+    print(f'\n== {title}')
+    for r in rows:
+        extra = ' '.join(f'{k}={v}' for k, v in r.items() if k not in ('stage', 'n', 'total_ms', 'per_s', 'peak_kb'))
+        print(f"  {r['stage']:<30} n={r['n']:<7} {r['total_ms']:>9} ms  {r['per_s'] or 0:>10}/s  peak {r['peak_kb']:>7} KB  {extra}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for the catalog, search, label and network paths.')
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=5)
+    parser.add_argument('--jitter', type=float, default=2)
+    parser.add_argument('--fail-rate', type=float, default=0.05)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--no-network', action='store_true')
+    parser.add_argument('--json', help='write all results to this file')
+    args = parser.parse_args()
+    report = {}
+    for size in (int(s) for s in args.sizes.split(',')):
+        rows = bench_catalog(size, args.queries)
+        print_rows(f'catalog {size}', rows)
+        report[f'catalog_{size}'] = rows
+        if not args.no_network:
+            rows = bench_network(size, args.requests, args.latency, args.jitter, args.fail_rate, args.drop_rate)
+            print_rows(f'network {size}', rows)
+            report[f'network_{size}'] = rows
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import os
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from discovery import DISCOVERY_PORT, make_reply, parse_request
+
+# ============================================
+class DiscoveryResponder:
+    # What the back-office has to run for scales to find it: answer each
+    # discovery datagram with the HTTP port, straight back to the sender.
+
+    def __init__(self, http_port, port=DISCOVERY_PORT, name=None, host=''):
+        self.http_port = http_port
+        self.name = name or socket.gethostname()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.port = self.sock.getsockname()[1]
+        self.answered = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='discovery-responder', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(512)
+            except OSError:
+                return
+            nonce = parse_request(data)
+            if nonce is None:
+                continue
+            try:
+                self.sock.sendto(make_reply(nonce, self.http_port, self.name), addr)
+                self.answered += 1
+            except OSError:
+                pass
+
+    def stop(self):
+        self.sock.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Answer scale discovery broadcasts for a MagPro server.')
+    parser.add_argument('--http-port', type=int, default=5000, help='port announced to the scales')
+    parser.add_argument('--port', type=int, default=DISCOVERY_PORT, help='UDP port to listen on')
+    parser.add_argument('--name', default=None)
+    args = parser.parse_args()
+    responder = DiscoveryResponder(args.http_port, args.port, args.name)
+    print(f'Answering discovery on udp/{responder.port} for http port {args.http_port}')
+    try:
+        responder.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
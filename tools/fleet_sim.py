@@ -0,0 +1,230 @@
+import argparse
+import heapq
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import CatalogSync, normalize_products
+from images import image_filename
+from net import ApiClient, ConnectivityMonitor, EndpointManager, HttpClient
+from printing import PRINT_ENDPOINT
+from telemetry import Telemetry
+
+# ============================================
+class _Handle:
+    __slots__ = ('fn', 'cancelled')
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Scheduler:
+    # One timer thread for the whole fleet instead of a threading.Timer per
+    # pending callback; same schedule(delay, fn) contract as net.thread_schedule.
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name='fleet-scheduler', daemon=True)
+        self._thread.start()
+
+    def schedule(self, delay, fn):
+        handle = _Handle(fn)
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), handle))
+            self._cond.notify()
+        return handle
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._heap.clear()
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if self._stopped:
+                    return
+                _, _, handle = heapq.heappop(self._heap)
+            if handle.cancelled:
+                continue
+            try:
+                handle.fn()
+            except Exception as e:
+                print(f'scheduler callback failed: {e!r}')
+
+# ============================================
+class VirtualScale:
+
+    def __init__(self, index, ips, port, scheduler, telemetry, rng, options):
+        self.index = index
+        self.scheduler = scheduler
+        self.telemetry = telemetry
+        self.rng = rng
+        self.options = options
+        self.http = HttpClient(workers=2, timeout=options.timeout)
+        self.endpoints = EndpointManager(ips)
+        self.api = ApiClient(self.http, self.endpoints, port, timeout=options.timeout, telemetry=telemetry)
+        self.monitor = ConnectivityMonitor(self.api, schedule=scheduler.schedule, min_interval=options.heartbeat, max_interval=options.heartbeat * 4)
+        self.api.on_reachable = self.monitor.note_success
+        self.api.on_unreachable = self.monitor.note_failure
+        self.sync = CatalogSync()
+        self.products = []
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self.monitor.start()
+        self.login()
+
+    def stop(self):
+        self.running = False
+        self.monitor.pause()
+        self.http.close()
+
+    def later(self, mean, fn):
+        if self.running and mean > 0:
+            self.scheduler.schedule(self.rng.expovariate(1 / mean), fn)
+
+    def login(self):
+        body = json.dumps({'username': f'scale{self.index}', 'password': 'x'})
+        self.api.request('/api/login', 'POST', body, {'Content-type': 'application/json'}, on_success=lambda req, res: self.on_login(), on_failure=lambda req, err: self.on_login_failed(), idempotent=True)
+
+    def on_login_failed(self):
+        self.telemetry.incr('login_retry')
+        self.later(2, self.login)
+
+    def on_login(self):
+        self.telemetry.incr('logged_in')
+        self.fetch_catalog()
+        self.later(self.options.print_interval, self.print_label)
+
+    def fetch_catalog(self):
+        if not self.running:
+            return
+        endpoint, headers = self.sync.request_args(bool(self.products))
+        self.api.request(endpoint, 'GET', None, headers, on_success=self.on_catalog, on_failure=lambda req, err: self.later(self.options.catalog_interval, self.fetch_catalog))
+
+    def on_catalog(self, req, res):
+        update = self.sync.parse(req.resp_status, req.resp_headers, res, bool(self.products))
+        if update['kind'] == 'full':
+            self.products = normalize_products(update['items'])
+            self.fetch_images()
+        elif update['kind'] == 'resync':
+            self.sync.reset()
+            self.later(1, self.fetch_catalog)
+            return
+        self.telemetry.incr(f"catalog_{update['kind']}")
+        self.sync.commit(update['etag'], update['revision'])
+        self.later(self.options.catalog_interval, self.fetch_catalog)
+
+    def fetch_images(self):
+        # Thumbnails bypass ApiClient in the app too (ImageLoader goes
+        # straight to HttpClient), so they are timed here under one name.
+        for p in self.products[:self.options.images]:
+            filename = image_filename(p['image'])
+            if filename:
+                self.http.request(self.api.url(self.endpoints.best(), f'/api/images/{filename}'), on_success=self.on_image, on_failure=self.on_image, on_error=self.on_image)
+
+    def on_image(self, req, result):
+        self.telemetry.record('GET /api/images/*', (req.elapsed or 0) * 1000, error=req.resp_status != 200)
+
+    def print_label(self):
+        if not self.running:
+            return
+        if self.products:
+            p = self.rng.choice(self.products)
+            payload = {'product_id': p['id'], 'weight': self.rng.randint(50, 3000), 'width_mm': 40, 'height_mm': 20, 'idempotency_key': uuid.uuid4().hex}
+            self.api.request(PRINT_ENDPOINT, 'POST', json.dumps(payload), {'Content-type': 'application/json', 'Idempotency-Key': payload['idempotency_key']}, idempotent=True)
+        self.later(self.options.print_interval, self.print_label)
+
+# ============================================
+def run(options):
+    server = None
+    ips = options.server.split(',')
+    port = options.port
+    if options.local:
+        from mock_server import MockServer
+        from synth import make_catalog
+        server = MockServer(port=0, items=make_catalog(options.products), latency_ms=options.latency, jitter_ms=options.jitter, fail_rate=options.fail_rate, drop_rate=options.drop_rate, seed=7).start()
+        ips, port = ['127.0.0.1'], server.port
+    telemetry = Telemetry(enabled=True, size=65536)
+    scheduler = Scheduler()
+    rng = random.Random(options.seed)
+    scales = [VirtualScale(i, ips, port, scheduler, telemetry, random.Random(rng.random()), options) for i in range(options.scales)]
+    started = time.monotonic()
+    for i, scale in enumerate(scales):
+        delay = options.ramp * i / max(1, len(scales) - 1) if options.ramp else 0
+        scheduler.schedule(delay, scale.start)
+    try:
+        time.sleep(options.duration)
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.monotonic() - started
+    scheduler.stop()
+    for scale in scales:
+        scale.stop()
+    if server:
+        server.stop()
+    snap = telemetry.snapshot()
+    snap['duration_s'] = round(elapsed, 1)
+    snap['heartbeats'] = sum(s.monitor.probes for s in scales)
+    snap['scales'] = len(scales)
+    return snap
+
+def print_report(snap):
+    duration = snap['duration_s']
+    print(f"\n{snap['scales']} scales for {duration}s, {snap['heartbeats']} heartbeat probes")
+    print(f"  {'request':<32} {'count':>7} {'rps':>7} {'err%':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for name, s in snap['timings_ms'].items():
+        if not s['count']:
+            continue
+        err = 100 * s['errors'] / s['count']
+        print(f"  {name[:32]:<32} {s['count']:>7} {s['count'] / duration:>7.1f} {err:>6.1f} {s['p50']:>8} {s['p90']:>8} {s['p99']:>8} {s['max']:>8}")
+    for name, n in snap['counters'].items():
+        print(f'  {name}: {n}')
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive N virtual scales against a MagPro server.')
+    parser.add_argument('--scales', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--ramp', type=float, default=0, help='spread scale start-ups over this many seconds (0 = login storm)')
+    parser.add_argument('--server', default='127.0.0.1', help='comma separated server IPs')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--timeout', type=float, default=5)
+    parser.add_argument('--heartbeat', type=float, default=5)
+    parser.add_argument('--print-interval', type=float, default=10, help='mean seconds between labels per scale')
+    parser.add_argument('--catalog-interval', type=float, default=60)
+    parser.add_argument('--images', type=int, default=12, help='thumbnails fetched per scale after a full catalog')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--local', action='store_true', help='run against an in-process mock server')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=5)
+    parser.add_argument('--jitter', type=float, default=2)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--json', help='write the raw report to this file')
+    options = parser.parse_args()
+    snap = run(options)
+    print_report(snap)
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(snap, f, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synth import make_catalog
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ============================================
+def make_image(size=(400, 300)):
+    if Image is None:
+        return b'\xff\xd8\xff\xd9'
+    buf = io.BytesIO()
+    Image.new('RGB', size, (200, 60, 60)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+class MockState:
+
+    def __init__(self, items, latency_ms=0, jitter_ms=0, fail_rate=0.0, drop_rate=0.0, seed=None):
+        self.items = {str(p['id']): p for p in items}
+        self.revision = 1
+        self.history = {}
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fail_rate = fail_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.image = make_image()
+        self.printed = []
+        self.sales = {}
+        self.seen_keys = set()
+        self.counters = {}
+        self.subscribers = []
+        self.keepalive = 15
+        self.lock = threading.Lock()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def etag(self):
+        return f'"r{self.revision}"'
+
+    def update(self, upserts=(), deleted=()):
+        with self.lock:
+            base = self.revision
+            changes = self.history.setdefault(base, {'upserts': [], 'deleted': []})
+            for p in upserts:
+                self.items[str(p['id'])] = p
+                changes['upserts'].append(p)
+            for i in deleted:
+                self.items.pop(str(i), None)
+                changes['deleted'].append(i)
+            self.revision += 1
+            event = {'base_revision': base, 'revision': self.revision, 'upserts': list(upserts), 'deleted': list(deleted)}
+            for q in self.subscribers:
+                q.put(event)
+            return self.revision
+
+    def subscribe(self):
+        q = queue.Queue()
+        with self.lock:
+            self.subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            if q in self.subscribers:
+                self.subscribers.remove(q)
+
+    def churn(self, count=1):
+        with self.lock:
+            picked = self.random.sample(list(self.items.values()), min(count, len(self.items)))
+        upserts = [dict(p, price=round(float(str(p['price']).replace(',', '.')) * self.random.uniform(0.9, 1.1), 2)) for p in picked]
+        return self.update(upserts)
+
+    def delta_since(self, since):
+        upserts, deleted = {}, []
+        for rev in range(since, self.revision):
+            changes = self.history.get(rev)
+            if changes is None:
+                return None
+            for p in changes['upserts']:
+                upserts[str(p['id'])] = p
+            deleted.extend(changes['deleted'])
+        return {'base_revision': since, 'revision': self.revision, 'upserts': list(upserts.values()), 'deleted': deleted}
+
+    def print_label(self, payload):
+        key = payload.get('idempotency_key')
+        with self.lock:
+            if key and key in self.seen_keys:
+                return {'idempotency_key': key, 'status': 'duplicate'}
+            if key:
+                self.seen_keys.add(key)
+            self.printed.append(payload)
+        return {'idempotency_key': key, 'status': 'ok'}
+
+    def record_sales(self, body):
+        # Rows are stored by (install, seq), so a resent batch or an
+        # overlapping range is never counted twice.
+        install = body.get('install', '')
+        added = 0
+        with self.lock:
+            rows = self.sales.setdefault(body.get('device', ''), {})
+            for row in body.get('rows', []):
+                if (install, row[0]) not in rows:
+                    rows[(install, row[0])] = row
+                    added += 1
+        return {'status': 'ok', 'rows': added}
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, code, body=b'', ctype='application/json', headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def inject(self):
+        st = self.state
+        st.count(urlsplit(self.path).path)
+        if st.latency_ms or st.jitter_ms:
+            time.sleep(max(0, st.latency_ms + st.random.uniform(-st.jitter_ms, st.jitter_ms)) / 1000)
+        roll = st.random.random()
+        if roll < st.drop_rate:
+            st.count('dropped')
+            self.close_connection = True
+            return True
+        if roll < st.drop_rate + st.fail_rate:
+            st.count('failed')
+            self.send(503, {'error': 'injected failure'})
+            return True
+        return False
+
+    def read_json(self):
+        n = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(n)
+        try:
+            if self.headers.get('Content-Encoding') == 'gzip':
+                data = gzip.decompress(data)
+            return json.loads(data or b'{}')
+        except (ValueError, OSError):
+            return None
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        if self.inject():
+            return
+        st = self.state
+        url = urlsplit(self.path)
+        if url.path == '/api/ping':
+            return self.send(200, {'status': 'ok'})
+        if url.path == '/api/products':
+            return self.get_products(parse_qs(url.query))
+        if url.path == '/api/events':
+            return self.stream_events()
+        if url.path.startswith('/api/images/'):
+            return self.send(200, st.image, 'image/jpeg')
+        if url.path == '/_stats':
+            with st.lock:
+                return self.send(200, {'counters': st.counters, 'printed': len(st.printed), 'sales': {d: len(rows) for d, rows in st.sales.items()}, 'revision': st.revision})
+        self.send(404, {'error': 'not found'})
+
+    def get_products(self, query):
+        st = self.state
+        with st.lock:
+            etag, revision = st.etag(), st.revision
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = None
+            since = query.get('since', [None])[0]
+            if since is not None and since.isdigit():
+                body = st.delta_since(int(since))
+            if body is None:
+                body = list(st.items.values())
+        self.send(200, body, headers={'ETag': etag, 'X-Catalog-Revision': str(revision)})
+
+    def write_event(self, event):
+        body = f"id: {event['revision']}\nevent: catalog\ndata: {json.dumps(event)}\n\n"
+        self.wfile.write(body.encode('utf-8'))
+
+    def stream_events(self):
+        st = self.state
+        q = st.subscribe()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            self.wfile.write(f'retry: 2000\nevent: hello\ndata: {json.dumps({"revision": st.revision})}\n\n'.encode('utf-8'))
+            last = self.headers.get('Last-Event-ID')
+            if last and last.isdigit() and int(last) < st.revision:
+                with st.lock:
+                    delta = st.delta_since(int(last))
+                if delta:
+                    self.write_event(delta)
+            self.wfile.flush()
+            while True:
+                try:
+                    event = q.get(timeout=st.keepalive)
+                except queue.Empty:
+                    self.wfile.write(b': keepalive\n\n')
+                else:
+                    self.write_event(event)
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            st.unsubscribe(q)
+
+    def do_POST(self):
+        if self.inject():
+            return
+        st = self.state
+        path = urlsplit(self.path).path
+        body = self.read_json()
+        if body is None:
+            return self.send(400, {'error': 'bad json'})
+        if path == '/api/login':
+            return self.send(200, {'status': 'success'})
+        if path == '/api/print_scale_label':
+            result = st.print_label(body)
+            return self.send(409 if result['status'] == 'duplicate' else 200, result)
+        if path == '/api/print_scale_labels':
+            return self.send(200, st.print_label(body))
+        if path == '/api/print_scale_label_batch':
+            return self.send(200, {'results': [st.print_label(job) for job in body.get('jobs', [])]})
+        if path == '/api/sales_journal':
+            return self.send(200, st.record_sales(body))
+        if path == '/_update':
+            return self.send(200, {'revision': st.update(body.get('upserts', []), body.get('deleted', []))})
+        if path == '/_churn':
+            return self.send(200, {'revision': st.churn(int(body.get('count', 1)))})
+        self.send(404, {'error': 'not found'})
+
+# ============================================
+class MockHTTPServer(ThreadingHTTPServer):
+    # The stdlib default backlog of 5 turns a login storm into 1s SYN
+    # retransmits, which would measure the stub rather than the client.
+    request_queue_size = 128
+    daemon_threads = True
+    block_on_close = False
+
+class MockServer:
+
+    def __init__(self, host='127.0.0.1', port=0, **options):
+        self.state = MockState(**options)
+        handler = type('Handler', (MockHandler,), {'state': self.state})
+        self.httpd = MockHTTPServer((host, port), handler)
+        self.port = self.httpd.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the MagPro back-office /api/* routes.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0, help='added latency per request (ms)')
+    parser.add_argument('--jitter', type=float, default=0, help='uniform +/- jitter (ms)')
+    parser.add_argument('--fail-rate', type=float, default=0, help='share of requests answered with 503')
+    parser.add_argument('--drop-rate', type=float, default=0, help='share of connections closed without a response')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--churn', type=float, default=0, help='change one price every N seconds and push it on /api/events')
+    parser.add_argument('--discovery', action='store_true', help='answer scale discovery broadcasts for this server')
+    args = parser.parse_args()
+    server = MockServer(args.host, args.port, items=make_catalog(args.products), latency_ms=args.latency, jitter_ms=args.jitter, fail_rate=args.fail_rate, drop_rate=args.drop_rate, seed=args.seed)
+    print(f'Mock server on {args.host}:{server.port} with {args.products} products')
+    if args.churn:
+        def churn():
+            while True:
+                time.sleep(args.churn)
+                server.state.churn()
+        threading.Thread(target=churn, name='churn', daemon=True).start()
+    if args.discovery:
+        from discovery_responder import DiscoveryResponder
+        responder = DiscoveryResponder(server.port).start()
+        print(f'Answering discovery on udp/{responder.port}')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import random
+
+LATIN = ('Pomme', 'Poire', 'Tomate', 'Oignon', 'Carotte', 'Banane', 'Fromage', 'Olive', 'Datte', 'Viande hachée', 'Poulet', 'Merguez')
+ARABIC = ('لحم بقري', 'دجاج', 'جبن', 'زيتون', 'تمر', 'طماطم', 'بصل', 'لحم غنم', 'كبدة', 'سمك', 'تفاح', 'موز')
+QUALIFIERS = ('extra', 'bio', 'premium', 'frais', 'import', 'ممتاز', 'طازج', 'محلي')
+UNITS = ('kg', 'kg', 'kg', 'Kg', 'g', 'gramme', 'كغ', 'litre', 'pièce', 'boite', 'u')
+
+# ============================================
+def make_catalog(n, seed=1):
+    rnd = random.Random(seed)
+    items = []
+    for i in range(n):
+        base = rnd.choice(LATIN if rnd.random() < 0.5 else ARABIC)
+        name = f'{base} {rnd.choice(QUALIFIERS)} {i}'
+        price = f'{rnd.randint(50, 4000)},{rnd.randint(0, 99):02d}' if rnd.random() < 0.5 else round(rnd.uniform(50, 4000), 2)
+        image = f'img\\p{i % 500}.jpg' if rnd.random() < 0.8 else ''
+        items.append({'id': i + 1, 'ref': str(100000 + i), 'name': name, 'price': price, 'unit': rnd.choice(UNITS), 'image': image})
+    return items
+
+def make_queries(items, count=200, seed=2):
+    rnd = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        p = rnd.choice(items)
+        kind = rnd.random()
+        if kind < 0.4:
+            word = p['name'].split()[0]
+            queries.append(word[:rnd.randint(1, len(word))])
+        elif kind < 0.7:
+            queries.append(p['ref'][:rnd.randint(2, 6)])
+        elif kind < 0.9:
+            queries.append(' '.join(p['name'].split()[:2]))
+        else:
+            queries.append('introuvable')
+    return queries